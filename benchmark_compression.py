@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Sweep compression settings over representative hirs_ctp_daily files, to
+         trade compression time against storage.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import json
+import shutil
+import argparse
+import logging
+import tempfile
+from itertools import product
+from os.path import basename, join as pjoin
+
+from flo.sw.hirs_ctp_daily.compression import CompressionSettings, compress
+from flo.sw.hirs2nc.utils import setup_logging
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+parser = argparse.ArgumentParser(description='Benchmark compression settings on daily files.')
+parser.add_argument('files', nargs='+', help='uncompressed hirs_ctp_daily files')
+parser.add_argument('--codecs', default='zlib', help='comma separated codecs (default: %(default)s)')
+parser.add_argument('--levels', default='1,4,6,9', help='comma separated levels (default: %(default)s)')
+parser.add_argument('--chunks', default='none',
+                    help='semicolon separated chunk specs like "latitude:90/longitude:180", '
+                         'or "none" (default: %(default)s)')
+parser.add_argument('--output', default=None, help='write the results as JSON lines here')
+args = parser.parse_args()
+
+setup_logging(1)
+
+chunk_specs = [None if spec == 'none' else
+               dict((dim, int(size)) for dim, size in [c.split(':') for c in spec.split('/')])
+               for spec in args.chunks.split(';')]
+
+work_dir = tempfile.mkdtemp()
+results = []
+try:
+    for codec, level, shuffle, chunks in product(args.codecs.split(','),
+                                                 [int(level) for level in args.levels.split(',')],
+                                                 [False, True], chunk_specs):
+        settings = CompressionSettings(codec=codec, level=level, shuffle=shuffle, chunks=chunks,
+                                       skip_compressed=False)
+        totals = {'bytes_in': 0, 'bytes_out': 0, 'elapsed': 0.}
+        for filename in args.files:
+            work_file = pjoin(work_dir, basename(filename))
+            shutil.copy(filename, work_file)
+            stats = {}
+            compress(work_file, settings, stats)
+            os.remove(work_file)
+            for key in totals:
+                totals[key] += stats[key]
+
+        result = {'codec': codec, 'level': level, 'shuffle': shuffle, 'chunks': chunks,
+                  'files': len(args.files)}
+        result.update(totals)
+        result['ratio'] = float(totals['bytes_out']) / max(totals['bytes_in'], 1)
+        results.append(result)
+        print('{codec:>8} level {level} shuffle {shuffle!s:>5} chunks {chunks!s:<40} '
+              'ratio {ratio:6.3f} {elapsed:8.2f}s'.format(**result))
+finally:
+    shutil.rmtree(work_dir)
+
+if args.output is not None:
+    with open(args.output, 'w') as f:
+        [f.write(json.dumps(result, sort_keys=True) + '\n') for result in results]
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Measure the cold start of hirs_ctp_daily in fresh interpreters: the time to
+         import it, and to go on and call find_contexts(), and which of the heavy
+         dependencies each of them pulls in. Planning should not load any of them.
+
+         python benchmarks/bench_import.py --importtime
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import sys
+import json
+import argparse
+import logging
+from subprocess import Popen, PIPE
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+HEAVY_MODULES = ['numpy', 'netCDF4', 'sipsprod', 'glutil', 'flo.sw.hirs_ctp_orbital',
+                 'flo.sw.hirs2nc', 'flo.sw.hirs_ctp_daily.sidecar']
+
+# Modules which the planning-only statements must leave unimported
+PLANNING_FORBIDDEN = HEAVY_MODULES
+
+STATEMENTS = [('import', 'import flo.sw.hirs_ctp_daily', True),
+              ('find_contexts',
+               'import flo.sw.hirs_ctp_daily as h\n'
+               'from timeutil import TimeInterval, datetime\n'
+               'h.HIRS_CTP_DAILY().find_contexts(TimeInterval(datetime(2015, 1, 1), datetime(2015, 12, 31)),\n'
+               '    "metop-b", "a", "b", "c", "d", "e", "f")', True),
+              ('full', 'import flo.sw.hirs_ctp_daily as h\n'
+                       'h.glutil.reraise_as, h.hirs_ctp_orbital.HIRS_CTP_ORBITAL, h.sidecar.SidecarIndex', False)]
+
+PROBE = '''
+import sys, time, json
+t0 = time.time()
+{statement}
+elapsed = time.time() - t0
+print(json.dumps({{'seconds': elapsed, 'modules': sorted(sys.modules)}}))
+'''
+
+
+def measure(statement, importtime=False):
+    '''
+    Run statement in a new interpreter, returning (seconds, loaded modules, -X importtime lines).
+    '''
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    proc = Popen(cmd + ['-c', PROBE.format(statement=statement)], stdout=PIPE, stderr=PIPE,
+                 universal_newlines=True)
+    out, err = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError('Probe failed:\n{}'.format(err))
+    result = json.loads(out.strip().splitlines()[-1])
+    return result['seconds'], result['modules'], [line for line in err.splitlines()
+                                                  if line.startswith('import time:')]
+
+
+def slowest_imports(lines, top=15):
+    '''
+    Return the top entries of -X importtime output by cumulative time, as (us, module).
+    '''
+    entries = []
+    for line in lines[1:]:
+        fields = line.split('|')
+        try:
+            entries.append((int(fields[1]), fields[2].strip()))
+        except (IndexError, ValueError):
+            continue
+    return sorted(entries, reverse=True)[:top]
+
+
+def run(repeat, importtime):
+    results = {}
+    failures = []
+    for name, statement, planning in STATEMENTS:
+        times = []
+        for _ in range(repeat):
+            seconds, modules, lines = measure(statement)
+            times.append(seconds)
+        heavy = [module for module in HEAVY_MODULES if module in modules]
+        results[name] = {'seconds': min(times), 'repeat': repeat, 'heavy_modules': heavy}
+        print('{:<16} {:10.4f}s  heavy modules: {}'.format(name, min(times), ', '.join(heavy) or 'none'))
+
+        if planning and [module for module in heavy if module in PLANNING_FORBIDDEN]:
+            failures.append(name)
+
+        if importtime and sys.version_info >= (3, 7):
+            _, _, lines = measure(statement, importtime=True)
+            for us, module in slowest_imports(lines):
+                print('    {:10.4f}s  {}'.format(us / 1e6, module))
+    return results, failures
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Measure the import time of hirs_ctp_daily.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='interpreters started for each statement, the fastest is kept '
+                             '(default: %(default)s)')
+    parser.add_argument('--importtime', action='store_true',
+                        help='also list the slowest imports, using python -X importtime (python 3.7+)')
+    parser.add_argument('--output', help='write the results here as JSON')
+    args = parser.parse_args()
+
+    results, failures = run(args.repeat, args.importtime)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if failures:
+        print('Heavy modules imported while planning: {}'.format(', '.join(failures)))
+        sys.exit(1)
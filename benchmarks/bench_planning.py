@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Time hirs_ctp_daily planning (find_contexts, build_task and the submission
+         loop) and task overhead against in-memory catalogs, so that results can be
+         compared between commits.
+
+         python benchmarks/bench_planning.py --output new.json --compare old.json
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import logging
+import tempfile
+import time
+from datetime import datetime, timedelta
+from subprocess import check_call
+from os.path import abspath, dirname, join as pjoin
+
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from timeutil import TimeInterval
+from flo.builder import WorkflowNotReady
+
+import flo.sw.hirs_ctp_daily as hirs_ctp_daily
+from flo.sw.hirs_ctp_daily.catalog import CachedProductCatalog
+from flo.sw.hirs_ctp_daily.compression import CompressionSettings
+from flo.sw.hirs_ctp_daily.instrumentation import Metrics
+from flo.sw.hirs_ctp_daily.orbital_cache import OrbitalContextCache
+from flo.sw.hirs_ctp_daily.submission import plan_contexts, SubmissionEngine, LocalSubmitter
+
+from fakes import (synthetic_orbits, FakeDeltaCatalog, FakeOrbitalComputation,
+                   FakeStoredProductCatalog, FakeDeliveredSoftware, FakeTask)
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+SATELLITE = 'metop-b'
+DELIVERY_IDS = ['20180410-1', '20180505-1', '20180714-1', '20180516-1', '20180730-1', '20180802-1']
+
+RANGES = {'day': (datetime(2015, 1, 1), datetime(2015, 1, 1)),
+          'month': (datetime(2015, 1, 1), datetime(2015, 1, 31)),
+          'mission': (datetime(2013, 1, 1), datetime(2017, 12, 31))}
+
+
+def interval(start, end):
+    return TimeInterval(start, end + timedelta(days=1) - timedelta(seconds=1))
+
+
+class Fakes(object):
+    '''
+    Points the hirs_ctp_daily module at fresh fakes.
+    '''
+
+    def __init__(self, orbits, work_dir):
+        self.orbital = FakeOrbitalComputation(orbits)
+        self.spc = FakeStoredProductCatalog()
+        hirs_ctp_daily.DeltaCatalog = FakeDeltaCatalog
+        hirs_ctp_daily.set_input_sources({}, satellite=SATELLITE)
+        hirs_ctp_daily.orbital_cache = OrbitalContextCache(self.orbital)
+        hirs_ctp_daily.product_catalog = CachedProductCatalog(self.spc)
+        hirs_ctp_daily.delivered_software = FakeDeliveredSoftware(pjoin(work_dir, 'delivery'))
+        hirs_ctp_daily.delivery_cache.clear()
+        hirs_ctp_daily.runscript = lambda cmd, deliveries: check_call(cmd, shell=True)
+        hirs_ctp_daily.metrics = Metrics(pjoin(work_dir, 'metrics.jsonl'))
+        hirs_ctp_daily.set_compression(CompressionSettings(codec='none'))
+
+        self.not_ready = 0
+
+    def build_task(self, comp, context, task):
+        try:
+            comp.build_task(context, task)
+        except WorkflowNotReady:
+            self.not_ready += 1
+
+    def counters(self):
+        return {'orbital_queries': self.orbital.queries, 'catalog_calls': self.spc.calls,
+                'not_ready': self.not_ready}
+
+
+class BuildingSubmitter(LocalSubmitter):
+    '''
+    LocalSubmitter which also builds each context's task, as safe_submit_order does.
+    '''
+
+    def __init__(self, fakes):
+        LocalSubmitter.__init__(self)
+        self.fakes = fakes
+
+    def __call__(self, comp, datasets, contexts, download_onlies=None):
+        for context in contexts:
+            self.fakes.build_task(comp, context, FakeTask())
+        return LocalSubmitter.__call__(self, comp, datasets, contexts, download_onlies)
+
+
+def bench_find_contexts(comp, fakes, start, end):
+    comp.find_contexts(interval(start, end), SATELLITE, *DELIVERY_IDS)
+
+
+def bench_build_task(comp, fakes, start, end):
+    for context in comp.find_contexts(interval(start, end), SATELLITE, *DELIVERY_IDS):
+        fakes.build_task(comp, context, FakeTask())
+
+
+def bench_submission(comp, fakes, start, end):
+    contexts = plan_contexts(comp, [interval(start, end)], SATELLITE, *DELIVERY_IDS)
+
+    def prefetch(batch):
+        hirs_ctp_daily.prefetch_orbital_contexts(TimeInterval(batch[0]['granule'], batch[-1]['granule']),
+                                                 SATELLITE, *DELIVERY_IDS[:-1])
+
+    SubmissionEngine(comp, [comp.dataset('out')], submit=BuildingSubmitter(fakes), prepare=prefetch,
+                     batch_size=31, workers=4).run(contexts)
+
+
+def bench_run_task(comp, fakes, start, end):
+    for context in comp.find_contexts(interval(start, end), SATELLITE, *DELIVERY_IDS):
+        task = FakeTask()
+        fakes.build_task(comp, context, task)
+        inputs = {}
+        for name, product in task.inputs.items():
+            inputs[name] = abspath(fakes.spc.file(product).path.replace('/', '_'))
+            open(inputs[name], 'w').close()
+        comp.run_task(inputs, context)
+
+
+BENCHMARKS = [('find_contexts', bench_find_contexts, ['day', 'month', 'mission']),
+              ('build_task', bench_build_task, ['day', 'month', 'mission']),
+              ('submission', bench_submission, ['day', 'month', 'mission']),
+              ('run_task', bench_run_task, ['day'])]
+
+
+def run(repeat):
+    orbits = synthetic_orbits(datetime(2012, 12, 30), datetime(2018, 1, 2))
+    results = {}
+    current_dir = os.getcwd()
+    for name, bench, ranges in BENCHMARKS:
+        for range_name in ranges:
+            start, end = RANGES[range_name]
+            times = []
+            for _ in range(repeat):
+                work_dir = tempfile.mkdtemp()
+                try:
+                    os.chdir(work_dir)
+                    fakes = Fakes(orbits, work_dir)
+                    comp = hirs_ctp_daily.HIRS_CTP_DAILY()
+                    t0 = time.time()
+                    bench(comp, fakes, start, end)
+                    times.append(time.time() - t0)
+                finally:
+                    os.chdir(current_dir)
+                    shutil.rmtree(work_dir)
+            key = '{}/{}'.format(name, range_name)
+            results[key] = dict(fakes.counters(), seconds=min(times), repeat=repeat)
+            print('{:<24} {:10.4f}s  {}'.format(key, min(times), fakes.counters()))
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''
+    Return the benchmarks which are more than threshold times slower than baseline.
+    '''
+    regressions = []
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        ratio = results[key]['seconds'] / max(baseline[key]['seconds'], 1e-9)
+        print('{:<24} {:10.4f}s -> {:10.4f}s  x{:.2f}'.format(
+            key, baseline[key]['seconds'], results[key]['seconds'], ratio))
+        if ratio > threshold:
+            regressions.append(key)
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark hirs_ctp_daily planning.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs of each benchmark, the fastest is kept (default: %(default)s)')
+    parser.add_argument('--output', help='write the results here as JSON')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown counted as a regression (default: %(default)s)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run(args.repeat)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print('Regressions: {}'.format(', '.join(regressions)))
+            sys.exit(1)
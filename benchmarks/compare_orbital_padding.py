@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Check the orbit-geometry query planner against the fixed +/- 6 hour orbital
+         query, over a year of synthetic orbits: every day must select the same CTP
+         Orbital contexts, and the planner should fetch far fewer.
+
+         python benchmarks/compare_orbital_padding.py --year 2015 --boundary-orbits 0 1
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import sys
+import argparse
+import logging
+from datetime import datetime, timedelta
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(abspath(__file__)))
+
+from timeutil import TimeInterval
+
+from flo.sw.hirs_ctp_daily.timeline import OrbitalTimeline
+from flo.sw.hirs_ctp_daily.orbit_geometry import OrbitGeometry, OrbitalQueryPlanner
+
+from fakes import synthetic_orbits, FakeOrbitalComputation, ORBIT_PERIOD
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+SATELLITE = 'metop-b'
+DELIVERY_IDS = ['20180410-1', '20180505-1', '20180714-1', '20180516-1', '20180730-1']
+FIXED_PADDING = timedelta(hours=6)
+
+
+class CountingQuery(object):
+    '''
+    Answers orbital queries from the fake computation, counting the contexts fetched.
+    '''
+
+    def __init__(self, orbital):
+        self.orbital = orbital
+        self.queries = 0
+        self.fetched = 0
+
+    def __call__(self, interval):
+        contexts = self.orbital.find_contexts(interval, SATELLITE, *DELIVERY_IDS)
+        self.queries += 1
+        self.fetched += len(contexts)
+        return contexts
+
+
+def compare(orbits, year, pad):
+    '''
+    Return (mismatched days, fixed query counts, planner query counts) for every day of year.
+    '''
+    orbital = FakeOrbitalComputation(orbits)
+    fixed = CountingQuery(orbital)
+    planned = CountingQuery(orbital)
+    planner = OrbitalQueryPlanner(OrbitGeometry(SATELLITE, period=ORBIT_PERIOD), pad, FIXED_PADDING)
+
+    mismatches = []
+    day = datetime(year, 1, 1)
+    while day.year == year:
+        contexts = fixed(TimeInterval(day - FIXED_PADDING, day + timedelta(days=1) + FIXED_PADDING))
+        expected = OrbitalTimeline(contexts).select(day, pad)
+        _, selected = planner.select([day], planned)
+        if [c['granule'] for c in selected[0]] != [c['granule'] for c in expected]:
+            mismatches.append(day)
+        day += timedelta(days=1)
+
+    return mismatches, fixed, planned, planner
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare the orbital query planner with fixed padding.')
+    parser.add_argument('--year', type=int, default=2015)
+    parser.add_argument('--boundary-orbits', type=int, nargs='+', default=[0, 1],
+                        help='boundary orbits either side of the day to compare (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic orbits')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    orbits = synthetic_orbits(datetime(args.year - 1, 12, 30), datetime(args.year + 1, 1, 2), seed=args.seed)
+
+    failed = False
+    for pad in args.boundary_orbits:
+        mismatches, fixed, planned, planner = compare(orbits, args.year, pad)
+        print('boundary orbits {}: fixed padding fetched {} contexts in {} queries, planner {} in {} '
+              'queries ({:.0f}% fewer, {} widenings), {} mismatched days'.format(
+                  pad, fixed.fetched, fixed.queries, planned.fetched, planned.queries,
+                  100. * (1. - float(planned.fetched) / max(fixed.fetched, 1)),
+                  planner.stats['widenings'], len(mismatches)))
+        for day in mismatches:
+            print('    mismatch on {}'.format(day.date()))
+        failed = failed or bool(mismatches)
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: In-memory stand-ins for the catalogs and delivered software used by
+         hirs_ctp_daily, and a synthetic orbit timeline generator, for benchmarking
+         without the cluster.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import stat
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from os.path import join as pjoin
+
+import numpy as np
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+# Nominal orbital period, in minutes, of the synthetic satellites
+ORBIT_PERIOD = 101.5
+
+STUB_BINARY = '''#!/bin/sh
+# Stand-in for create_daily_daynight_ctps.exe: create_daily_daynight_ctps.exe <list> <output>
+touch "$2"
+'''
+
+
+def synthetic_orbits(start, end, period=ORBIT_PERIOD, drop_fraction=0.02, gap_rate=0.002,
+                     max_gap_orbits=40, seed=0):
+    '''
+    Return the sorted orbit start times between start and end: about 14 orbits a day,
+    with a few seconds of jitter, a fraction of single orbits dropped and occasional
+    multi-orbit outages.
+    '''
+    rng = np.random.RandomState(seed)
+    num_orbits = int((end - start).total_seconds() / (period * 60.)) + 1
+    offsets = np.arange(num_orbits) * period * 60. + rng.uniform(-30., 30., num_orbits)
+    keep = rng.uniform(size=num_orbits) >= drop_fraction
+    for gap_start in np.nonzero(rng.uniform(size=num_orbits) < gap_rate)[0]:
+        keep[gap_start:gap_start + rng.randint(1, max_gap_orbits)] = False
+    return [start + timedelta(seconds=float(offset)) for offset in offsets[keep]
+            if start + timedelta(seconds=float(offset)) < end]
+
+
+class FakeDataset(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def product(self, context):
+        return (self.name, context['satellite'], context['granule'])
+
+
+class FakeOrbitalComputation(object):
+    '''
+    Stand-in for HIRS_CTP_ORBITAL, whose find_contexts() answers from a synthetic
+    orbit timeline and counts the queries made.
+    '''
+
+    def __init__(self, orbits):
+        self.orbits = orbits
+        self.queries = 0
+
+    def find_contexts(self, interval, satellite, hirs2nc_delivery_id, hirs_avhrr_delivery_id,
+                      hirs_csrb_daily_delivery_id, hirs_csrb_monthly_delivery_id,
+                      hirs_ctp_orbital_delivery_id):
+        self.queries += 1
+        start = bisect_left(self.orbits, interval.left)
+        end = bisect_right(self.orbits, interval.right)
+        return [{'granule': granule,
+                 'satellite': satellite,
+                 'hirs2nc_delivery_id': hirs2nc_delivery_id,
+                 'hirs_avhrr_delivery_id': hirs_avhrr_delivery_id,
+                 'hirs_csrb_daily_delivery_id': hirs_csrb_daily_delivery_id,
+                 'hirs_csrb_monthly_delivery_id': hirs_csrb_monthly_delivery_id,
+                 'hirs_ctp_orbital_delivery_id': hirs_ctp_orbital_delivery_id}
+                for granule in self.orbits[start:end]]
+
+    def dataset(self, name):
+        return FakeDataset(name)
+
+
+class FakeFile(object):
+
+    def __init__(self, path):
+        self.path = path
+
+
+class FakeStoredProductCatalog(object):
+    '''
+    Stand-in for StoredProductCatalog: products exist unless in missing, and their
+    files are named after the product. Counts the calls made.
+    '''
+
+    def __init__(self, missing=()):
+        self.missing = set(missing)
+        self.calls = 0
+
+    def exists(self, product):
+        self.calls += 1
+        return product not in self.missing
+
+    def file(self, product):
+        self.calls += 1
+        return FakeFile('{}/{}_{}.nc'.format(product[0], product[1], product[2].strftime('%Y%m%dT%H%M%S')))
+
+
+class FakeDeltaCatalog(object):
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def file(self, sensor, satellite, file_type, granule):
+        return None
+
+    def files(self, sensor, satellite, file_type, interval):
+        return []
+
+
+class FakeDelivery(object):
+
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+
+
+class FakeDeliveredSoftware(object):
+    '''
+    Stand-in for glutil.delivered_software, whose deliveries all contain the stub
+    CTP daily binary.
+    '''
+
+    def __init__(self, root, version='v00000000'):
+        self.root = root
+        self.version = version
+        bin_dir = pjoin(root, 'dist', 'bin')
+        if not os.path.isdir(bin_dir):
+            os.makedirs(bin_dir)
+        binary = pjoin(bin_dir, 'create_daily_daynight_ctps.exe')
+        with open(binary, 'w') as f:
+            f.write(STUB_BINARY)
+        os.chmod(binary, os.stat(binary).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    def lookup(self, name, delivery_id=None):
+        return FakeDelivery(self.root, self.version)
+
+
+class FakeTask(object):
+    '''
+    Collects the inputs build_task() adds.
+    '''
+
+    def __init__(self):
+        self.inputs = {}
+
+    def input(self, name, product):
+        self.inputs[name] = product
+
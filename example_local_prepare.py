@@ -20,6 +20,7 @@ from flo.ui import local_prepare, local_execute
 
 import flo.sw.hirs_ctp_orbital as hirs_ctp_orbital
 import flo.sw.hirs_ctp_daily as hirs_ctp_daily
+from flo.sw.hirs_ctp_daily.local_batch import LocalBatchRunner
 
 from flo.sw.hirs2nc.utils import setup_logging
 
@@ -132,6 +133,28 @@ def local_execute_example(interval, satellite, hirs2nc_delivery_id, hirs_avhrr_d
     else:
         LOG.error("There are no valid {} contexts for the interval {}.".format(satellite, interval))
 
+def local_batch_example(interval, satellite, hirs2nc_delivery_id, hirs_avhrr_delivery_id,
+                        hirs_csrb_daily_delivery_id, hirs_csrb_monthly_delivery_id,
+                        hirs_ctp_orbital_delivery_id, hirs_ctp_daily_delivery_id,
+                        workers=4, scratch_root='.', skip_prepare=False, skip_execute=False,
+                        verbosity=2):
+
+    setup_logging(verbosity)
+
+    comp = setup_computation(satellite)
+
+    contexts = comp.find_contexts(interval, satellite, hirs2nc_delivery_id, hirs_avhrr_delivery_id,
+                                  hirs_csrb_daily_delivery_id, hirs_csrb_monthly_delivery_id,
+                                  hirs_ctp_orbital_delivery_id, hirs_ctp_daily_delivery_id)
+
+    if len(contexts) != 0:
+        LOG.info("Running {} contexts, {} at a time...".format(len(contexts), workers))
+        runner = LocalBatchRunner(setup_computation, workers=workers, scratch_root=scratch_root)
+        return runner.run(contexts, skip_prepare=skip_prepare, skip_execute=skip_execute,
+                          report=pjoin(scratch_root, 'local_batch_report.json'))
+    else:
+        LOG.error("There are no valid {} contexts for the interval {}.".format(satellite, interval))
+
 def print_contexts(interval, satellite, hirs2nc_delivery_id, hirs_avhrr_delivery_id,
                    hirs_csrb_daily_delivery_id, hirs_csrb_monthly_delivery_id,
                    hirs_ctp_orbital_delivery_id, hirs_ctp_daily_delivery_id, verbosity=2):
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Plan the hirs_ctp_daily inputs of every day of a satellite's mission once, and
+         write them as a manifest for submit_hirs_ctp_daily.py --mission-plan. Given an
+         earlier manifest, report which days have changed.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from timeutil import TimeInterval
+
+import flo.sw.hirs_ctp_daily as hirs_ctp_daily
+from flo.sw.hirs_ctp_daily.campaign import missions
+from flo.sw.hirs_ctp_daily.manifest import Manifest, plan_manifest, diff_manifests
+from flo.sw.hirs_ctp_daily.submission import setup_computation, monthly_intervals, plan_contexts
+from flo.sw.hirs2nc.utils import setup_logging
+
+# every module should have a LOG object
+import logging
+LOG = logging.getLogger(__name__)
+
+
+def parse_date(text):
+    return datetime.strptime(text, '%Y-%m-%d')
+
+parser = argparse.ArgumentParser(description='Plan the hirs_ctp_daily inputs of a mission into a manifest.')
+parser.add_argument('satellite')
+parser.add_argument('output', help='manifest file to write')
+parser.add_argument('--start', type=parse_date, help='first day, as YYYY-MM-DD (default: start of mission)')
+parser.add_argument('--end', type=parse_date, help='last day, as YYYY-MM-DD (default: end of mission)')
+parser.add_argument('--diff', metavar='MANIFEST', help='earlier manifest to report the changed days against')
+parser.add_argument('--hirs2nc-delivery-id', default='20180410-1')
+parser.add_argument('--hirs-avhrr-delivery-id', default='20180505-1')
+parser.add_argument('--hirs-csrb-daily-delivery-id', default='20180714-1')
+parser.add_argument('--hirs-csrb-monthly-delivery-id', default='20180516-1')
+parser.add_argument('--hirs-ctp-orbital-delivery-id', default='20180730-1')
+parser.add_argument('--hirs-ctp-daily-delivery-id', default='20180802-1')
+args = parser.parse_args()
+
+setup_logging(2)
+
+start, end = missions.get(args.satellite, (None, None))
+start = args.start if args.start is not None else start
+end = args.end if args.end is not None else end
+if start is None or end is None:
+    parser.error('No mission date range known for {}, give --start and --end'.format(args.satellite))
+
+delivery_ids = [args.hirs2nc_delivery_id, args.hirs_avhrr_delivery_id, args.hirs_csrb_daily_delivery_id,
+                args.hirs_csrb_monthly_delivery_id, args.hirs_ctp_orbital_delivery_id]
+
+# Plan from the catalogs, not from a mission plan set in the environment
+hirs_ctp_daily.set_mission_plan(None)
+
+comp = setup_computation(args.satellite)
+contexts = plan_contexts(comp, monthly_intervals(start, end), args.satellite,
+                         *(delivery_ids + [args.hirs_ctp_daily_delivery_id]))
+
+# One orbital query for the whole mission
+hirs_ctp_daily.prefetch_orbital_contexts(TimeInterval(start, end + timedelta(days=1)), args.satellite,
+                                         *delivery_ids)
+manifest = plan_manifest(comp, contexts)
+manifest.write(args.output)
+print('Planned {} of {} days into {}'.format(len(manifest), len(contexts), args.output))
+
+if args.diff is not None:
+    changes = diff_manifests(Manifest.read(args.diff), manifest)
+    for change in ['added', 'removed', 'changed']:
+        print('{} {}: {}'.format(len(changes[change]), change,
+                                 ' '.join([day for _, day in changes[change]])))
@@ -12,42 +12,251 @@ import os
 from os.path import basename, dirname, curdir, abspath, isdir, isfile, exists, splitext, join as pjoin
 import sys
 from glob import glob
+from calendar import monthrange
 import shutil
 import logging
 import traceback
 from subprocess import CalledProcessError
-import numpy as np
 
 from flo.computation import Computation
 from flo.builder import WorkflowNotReady
 from timeutil import TimeInterval, datetime, timedelta, round_datetime
 from flo.util import augmented_env, symlink_inputs_to_working_dir
-from flo.product import StoredProductCatalog
-
-import sipsprod
-from glutil import (
-    check_call,
-    dawg_catalog,
-    delivered_software,
-    #support_software,
-    runscript,
-    #prepare_env,
-    #nc_gen,
-    nc_compress,
-    reraise_as,
-    #set_official_product_metadata,
-    FileNotFound
-)
-import flo.sw.hirs_ctp_orbital as hirs_ctp_orbital
-from flo.sw.hirs2nc.delta import DeltaCatalog
-from flo.sw.hirs2nc.utils import link_files
+from flo.sw.hirs_ctp_daily.lazy import LazyObject, deferred_decorator
+
+# The heavy dependencies are only imported when first used, so that planning processes
+# which just need find_contexts() start quickly.
+StoredProductCatalog = LazyObject('flo.product', 'StoredProductCatalog')
+sipsprod = LazyObject('sipsprod')
+glutil = LazyObject('glutil')
+check_call = LazyObject('glutil', 'check_call')
+dawg_catalog = LazyObject('glutil', 'dawg_catalog')
+delivered_software = LazyObject('glutil', 'delivered_software')
+runscript = LazyObject('glutil', 'runscript')
+nc_compress = LazyObject('glutil', 'nc_compress')
+hirs_ctp_orbital = LazyObject('flo.sw.hirs_ctp_orbital')
+DeltaCatalog = LazyObject('flo.sw.hirs2nc.delta', 'DeltaCatalog')
+link_files = LazyObject('flo.sw.hirs2nc.utils', 'link_files')
+sidecar = LazyObject('flo.sw.hirs_ctp_daily.sidecar')
+OrbitalTimeline = LazyObject('flo.sw.hirs_ctp_daily.timeline', 'OrbitalTimeline')
+satellite_boundary_orbits = LazyObject('flo.sw.hirs_ctp_daily.timeline', 'satellite_boundary_orbits')
+OrbitGeometry = LazyObject('flo.sw.hirs_ctp_daily.orbit_geometry', 'OrbitGeometry')
+OrbitalQueryPlanner = LazyObject('flo.sw.hirs_ctp_daily.orbit_geometry', 'OrbitalQueryPlanner')
+query_padding = LazyObject('flo.sw.hirs_ctp_daily.orbit_geometry', 'query_padding')
+
+from flo.sw.hirs_ctp_daily.orbital_cache import OrbitalContextCache
+from flo.sw.hirs_ctp_daily.catalog import CachedProductCatalog, product_key
+from flo.sw.hirs_ctp_daily.delta_cache import DeltaCatalogCache
+from flo.sw.hirs_ctp_daily.delivery_cache import DeliveryCache
+from flo.sw.hirs_ctp_daily.manifest import Manifest
+from flo.sw.hirs_ctp_daily.outcome import (SUCCESS, PERMANENT, SKIPPED, TaskFailure, OutcomeLedger,
+                                           classify, exception_outcome, run_with_retries)
+from flo.sw.hirs_ctp_daily.result_cache import ResultCache, fingerprint
+from flo.sw.hirs_ctp_daily.compression import CompressionSettings, compress
+from flo.sw.hirs_ctp_daily.staging import StagingCache
+from flo.sw.hirs_ctp_daily.instrumentation import Metrics, context_fields, input_bytes
 
 # every module should have a LOG object
 LOG = logging.getLogger(__name__)
 
-def set_input_sources(input_locations):
+# glutil.reraise_as, applied when the decorated method is first called
+reraise_as_not_ready = deferred_decorator(
+    lambda: glutil.reraise_as(WorkflowNotReady, glutil.FileNotFound, prefix='HIRS_CTP_DAILY'))
+
+# Per-phase timings of the tasks, written as JSON lines if set_metrics() is called, or if
+# HIRS_CTP_DAILY_METRICS is set in the environment to the metrics file
+metrics = Metrics(os.environ.get('HIRS_CTP_DAILY_METRICS') or None)
+
+def set_metrics(filename):
+    global metrics
+    metrics = Metrics(filename)
+
+# Most padding added to each end of the day when searching for CTP Orbital inputs. The
+# search starts with just enough for the boundary orbits, from the satellite's orbit
+# geometry, and only widens up to this if they are missing.
+orbital_padding = timedelta(hours=6)
+
+# Data locations, set up with set_input_sources()
+delta_catalog = None
+delta_catalogs = {}
+input_sources = {}
+
+def _data_lists_reloaded(input_locations):
+    # The orbital contexts found with the old data lists may be out of date
+    satellites = [satellite for satellite, locations in input_sources.items() if locations == input_locations]
+    if satellites == []:
+        orbital_cache.invalidate()
+    for satellite in satellites:
+        orbital_cache.invalidate_satellite(satellite)
+
+# DeltaCatalogs shared by every set_input_sources() call of this process, so the data lists
+# are only parsed once however many times the computation is set up
+delta_catalog_cache = DeltaCatalogCache(lambda input_locations: DeltaCatalog(**input_locations),
+                                        on_reload=_data_lists_reloaded)
+
+def get_delta_catalog(satellite):
+    '''
+    Return the DeltaCatalog for satellite, or the last one set up if there isn't one.
+    '''
+    if satellite in input_sources:
+        return delta_catalog_cache.get(input_sources[satellite])
+    return delta_catalogs.get(satellite, delta_catalog)
+
+def _bind_orbital_catalog(satellite):
+    # Initialize the hirs_ctp_orbital module with the data locations
+    hirs_ctp_orbital.delta_catalog = get_delta_catalog(satellite)
+
+# Orbital contexts shared between the build_task() calls of this process
+orbital_cache = OrbitalContextCache(bind=_bind_orbital_catalog)
+
+# StoredProductCatalog lookups, remembered between the build_task() calls of this process
+product_catalog = CachedProductCatalog()
+
+# Cache of previous outputs, used by run_task() if set_result_cache() is called, or if
+# HIRS_CTP_DAILY_RESULT_CACHE is set in the environment to the cache directory.
+result_cache = None
+
+def set_result_cache(root, max_bytes=None):
+    global result_cache
+    if root is None:
+        result_cache = None
+    elif max_bytes is None:
+        result_cache = ResultCache(root)
+    else:
+        result_cache = ResultCache(root, max_bytes=max_bytes)
+
+if os.environ.get('HIRS_CTP_DAILY_RESULT_CACHE'):
+    set_result_cache(os.environ['HIRS_CTP_DAILY_RESULT_CACHE'],
+                     int(os.environ.get('HIRS_CTP_DAILY_RESULT_CACHE_BYTES', 10 * 1024**3)))
+
+# Resolved deliveries, shared by the tasks of this process and, if set_delivery_cache() is
+# called or HIRS_CTP_DAILY_DELIVERY_CACHE is set to a directory, by the tasks on this node.
+delivery_cache = DeliveryCache(lambda name, delivery_id: delivered_software.lookup(name, delivery_id=delivery_id))
+
+def set_delivery_cache(cache_dir):
+    global delivery_cache
+    delivery_cache = DeliveryCache(delivery_cache.lookup, cache_dir)
+
+if os.environ.get('HIRS_CTP_DAILY_DELIVERY_CACHE'):
+    set_delivery_cache(os.environ['HIRS_CTP_DAILY_DELIVERY_CACHE'])
+
+def lookup_delivery(delivery_id):
+    '''
+    Return the hirs_ctp_daily delivery with delivery_id, from the delivery cache if it
+    is still valid.
+    '''
+    with metrics.span('delivery_lookup', delivery_id=delivery_id) as span:
+        delivery = delivery_cache.get('hirs_ctp_daily', delivery_id)
+        span.set(source=delivery_cache.source, **delivery_cache.stats)
+    return delivery
+
+# How run_task() compresses the daily file; by default with glutil.nc_compress. Can be
+# set with set_compression(), or HIRS_CTP_DAILY_COMPRESSION="codec=zlib,level=4,..."
+compression_settings = CompressionSettings.from_string(os.environ.get('HIRS_CTP_DAILY_COMPRESSION', ''))
+
+def set_compression(settings):
+    global compression_settings
+    compression_settings = settings
+
+# Node-local copies of the CTP Orbital inputs, used by run_task() if set_staging_cache() is
+# called, or if HIRS_CTP_DAILY_STAGING_DIR is set in the environment to the cache directory.
+staging_cache = None
+
+def set_staging_cache(root, max_bytes=None):
+    global staging_cache
+    if root is None:
+        staging_cache = None
+    elif max_bytes is None:
+        staging_cache = StagingCache(root)
+    else:
+        staging_cache = StagingCache(root, max_bytes=max_bytes)
+
+if os.environ.get('HIRS_CTP_DAILY_STAGING_DIR'):
+    set_staging_cache(os.environ['HIRS_CTP_DAILY_STAGING_DIR'],
+                      int(os.environ.get('HIRS_CTP_DAILY_STAGING_BYTES', 50 * 1024**3)))
+
+# Directory of the statistics sidecars and their per-satellite indexes, which run_task() writes
+# each day to if set_sidecar_index() is called, or if HIRS_CTP_DAILY_SIDECAR_INDEX is set. A
+# sidecar which can't be written is only warned about; the daily file is still the output.
+sidecar_index_root = None
+
+def set_sidecar_index(root):
+    global sidecar_index_root
+    sidecar_index_root = root
+
+if os.environ.get('HIRS_CTP_DAILY_SIDECAR_INDEX'):
+    set_sidecar_index(os.environ['HIRS_CTP_DAILY_SIDECAR_INDEX'])
+
+# How often create_ctp_daily() tries the binary when it fails transiently, and the backoff
+# between tries, doubling from retry_backoff up to max_retry_backoff seconds
+task_attempts = 3
+retry_backoff = 30.
+max_retry_backoff = 300.
+
+# Shared record of task outcomes, kept by run_task() if set_outcome_ledger() is called, or
+# if HIRS_CTP_DAILY_OUTCOMES is set to the ledger file. Unless fail_fast is off (with
+# set_fail_fast(False), or HIRS_CTP_DAILY_FAIL_FAST=0), tasks of a satellite and delivery
+# which keep failing permanently are then skipped before they start.
+outcome_ledger = None
+fail_fast = os.environ.get('HIRS_CTP_DAILY_FAIL_FAST', '1') != '0'
+
+def set_outcome_ledger(filename):
+    global outcome_ledger
+    outcome_ledger = None if filename is None else OutcomeLedger(filename)
+
+def set_fail_fast(enabled):
+    global fail_fast
+    fail_fast = enabled
+
+if os.environ.get('HIRS_CTP_DAILY_OUTCOMES'):
+    set_outcome_ledger(os.environ['HIRS_CTP_DAILY_OUTCOMES'])
+
+# Planned inputs of each day, used by build_task() instead of querying the catalogs if
+# set_mission_plan() is called, or if HIRS_CTP_DAILY_MISSION_PLAN is set to the manifest.
+mission_plan = None
+
+def set_mission_plan(filename):
+    global mission_plan
+    mission_plan = None if filename is None else Manifest.read(filename)
+
+if os.environ.get('HIRS_CTP_DAILY_MISSION_PLAN'):
+    set_mission_plan(os.environ['HIRS_CTP_DAILY_MISSION_PLAN'])
+
+def set_input_sources(input_locations, satellite=None):
     global delta_catalog
-    delta_catalog = DeltaCatalog(**input_locations)
+    previous = delta_catalogs.get(satellite, delta_catalog)
+    delta_catalog = delta_catalog_cache.get(input_locations)
+    # The orbital contexts depend on the data lists, so forget any we found before, unless
+    # this is the same catalog again
+    if satellite is None:
+        input_sources.clear()
+        delta_catalogs.clear()
+        if delta_catalog is not previous:
+            orbital_cache.invalidate()
+    else:
+        input_sources[satellite] = input_locations
+        delta_catalogs[satellite] = delta_catalog
+        if delta_catalog is not previous:
+            orbital_cache.invalidate_satellite(satellite)
+
+def prefetch_orbital_contexts(time_interval, satellite, hirs2nc_delivery_id, hirs_avhrr_delivery_id,
+                              hirs_csrb_daily_delivery_id, hirs_csrb_monthly_delivery_id,
+                              hirs_ctp_orbital_delivery_id):
+    '''
+    Query the CTP Orbital contexts for a whole submission range in one go, so that
+    the build_task() calls for the individual days are answered from orbital_cache.
+    '''
+    padding = query_padding(satellite, satellite_boundary_orbits(satellite), orbital_padding)
+    interval = TimeInterval(time_interval.left - padding,
+                            time_interval.right + timedelta(days=1) + padding)
+    context = {'satellite': satellite,
+               'hirs2nc_delivery_id': hirs2nc_delivery_id,
+               'hirs_avhrr_delivery_id': hirs_avhrr_delivery_id,
+               'hirs_csrb_daily_delivery_id': hirs_csrb_daily_delivery_id,
+               'hirs_csrb_monthly_delivery_id': hirs_csrb_monthly_delivery_id,
+               'hirs_ctp_orbital_delivery_id': hirs_ctp_orbital_delivery_id}
+    orbital_cache.prefetch(interval, context)
+    LOG.info("Orbital context cache stats: {}".format(orbital_cache.stats))
 
 class HIRS_CTP_DAILY(Computation):
 
@@ -74,99 +283,93 @@ class HIRS_CTP_DAILY(Computation):
                  'hirs_ctp_daily_delivery_id': hirs_ctp_daily_delivery_id}
                 for g in granules]
 
-    @reraise_as(WorkflowNotReady, FileNotFound, prefix='HIRS_CTP_DAILY')
+    @reraise_as_not_ready
     def build_task(self, context, task):
         '''
         Build up a set of inputs for a single context
         '''
-        global delta_catalog
+        with metrics.span('build_task', **context_fields(context)):
+            self._build_task(context, task)
+
+    def _build_task(self, context, task):
 
         LOG.debug("Running build_task()")
 
-        # Initialize the hirs_ctp_orbital module with the data locations
-        hirs_ctp_orbital.delta_catalog = delta_catalog
+        # CTP Orbital Input
+        hirs_ctp_orbital_contexts = self.orbital_contexts(context)
+        for hirs_ctp_orbital_context in hirs_ctp_orbital_contexts:
+            LOG.info("{}".format(hirs_ctp_orbital_context))
 
-        # Instantiate the hirs_ctp_orbital computation
-        hirs_ctp_orbital_comp = hirs_ctp_orbital.HIRS_CTP_ORBITAL()
+        hirs_ctp_orbital_prods = self._existing_products(context,
+                                                         self.orbital_products(hirs_ctp_orbital_contexts))
+        for idx,hirs_ctp_orbital_prod in enumerate(hirs_ctp_orbital_prods):
+            task.input('CTPO-{}'.format(idx), hirs_ctp_orbital_prod)
 
-        SPC = StoredProductCatalog()
+    def orbital_contexts(self, context):
+        '''
+        Return the CTP Orbital contexts making up the day of context.
+        '''
+        return self._find_orbital_contexts(context, [context['granule']])[0]
 
-        # CTP Orbital Input
+    def orbital_products(self, orbital_contexts):
+        hirs_ctp_orbital_comp = orbital_cache.computation
+        return [hirs_ctp_orbital_comp.dataset('out').product(orbital_context)
+                for orbital_context in orbital_contexts]
 
-        granule = context['granule']
-        wedge = timedelta(seconds=1)
-        hour = timedelta(hours=1)
-        day = timedelta(days=1)
+    def _existing_products(self, context, products):
+        '''
+        Return those of products which are in the product store. Those planned in the
+        mission plan were checked when it was made.
+        '''
+        if mission_plan is not None and mission_plan.covers(context):
+            return products
+        with metrics.span('product_exists', num_products=len(products)):
+            return product_catalog.exists(products)
 
-        # Add 6 hours to each end of the day to make sure the day is completely covered
-        interval = TimeInterval(context['granule'] - 6*hour, (context['granule'] + day + 6*hour))
+    def _find_orbital_contexts(self, context, days):
+        '''
+        Return a list of the CTP Orbital contexts making up each of days.
+        '''
         LOG.info("granule: {}".format(context['granule']))
-        LOG.info("interval: {}".format(interval))
 
-        hirs_ctp_orbital_contexts = hirs_ctp_orbital_comp.find_contexts(
-                                                                interval,
-                                                                context['satellite'],
-                                                                context['hirs2nc_delivery_id'],
-                                                                context['hirs_avhrr_delivery_id'],
-                                                                context['hirs_csrb_daily_delivery_id'],
-                                                                context['hirs_csrb_monthly_delivery_id'],
-                                                                context['hirs_ctp_orbital_delivery_id'])
+        if mission_plan is not None and mission_plan.covers(context):
+            LOG.info("Taking the CTP Orbital contexts from the mission plan")
+            return mission_plan.orbital_contexts(context)
+
+        # Query just enough either side of the days for the boundary orbits, widening up to
+        # orbital_padding if they are missing. Answered from memory if the range was
+        # prefetched with prefetch_orbital_contexts().
+        pad = satellite_boundary_orbits(context['satellite'])
+        planner = OrbitalQueryPlanner(OrbitGeometry(context['satellite']), pad, orbital_padding)
+
+        def query(interval):
+            LOG.info("interval: {}".format(interval))
+            return orbital_cache.find_contexts(interval, context)
+
+        with metrics.span('find_orbital_contexts') as span:
+            hirs_ctp_orbital_contexts, selected = planner.select(days, query)
+            span.set(num_contexts=len(hirs_ctp_orbital_contexts), **planner.stats)
 
         if len(hirs_ctp_orbital_contexts) == 0:
             raise WorkflowNotReady('No HIRS_CTP_ORBITAL inputs available for {}'.format(context['granule']))
 
         LOG.info("There are {} CTP Orbital contexts.".format(len(hirs_ctp_orbital_contexts)))
+        LOG.info("Selected {} CTP Orbital contexts ({} boundary orbits).".format(
+            sum([len(contexts) for contexts in selected]), pad))
+        return selected
 
-        #for context in hirs_ctp_orbital_contexts:
-            #LOG.info(context)
-
-        # Knock off all but the last of the "previous" day's contexts
-        this_day = granule.day
-        previous_day = (granule - day + wedge).day
-        next_day = (granule + day + wedge).day
-        LOG.info("previous_day: {}".format(previous_day))
-        LOG.info("this_day: {}".format(this_day))
-        LOG.info("next_day: {}".format(next_day))
-
-        start_idx = 0
-        end_idx = -1
-        num_contexts = len(hirs_ctp_orbital_contexts)
-
-        indices = np.arange(num_contexts)
-        reverse_indices = np.flip(np.arange(num_contexts)-num_contexts, axis=0)
-
-        # have this set to zero unless we need to set it otherwise (say for Metop-B)
-        interval_pad = 0
-
-        # Pruning all but the last of the previous day's contexts
-        for idx in indices:
-            if hirs_ctp_orbital_contexts[idx+interval_pad]['granule'].day == this_day:
-                start_idx = idx
-                LOG.info("Breaking: start_idx = {}, granule = {}".format(
-                    start_idx, hirs_ctp_orbital_contexts[start_idx]['granule']))
-                break
-
-        # Pruning all but the first of the next day's contexts
-        for idx in reverse_indices:
-            if hirs_ctp_orbital_contexts[idx-interval_pad]['granule'].day == this_day:
-                end_idx = idx
-                LOG.info("Breaking: end_idx = {}, granule = {}".format(
-                    end_idx, hirs_ctp_orbital_contexts[end_idx]['granule']))
-                break
-
-        hirs_ctp_orbital_contexts = hirs_ctp_orbital_contexts[start_idx:end_idx+1]
-        for context in hirs_ctp_orbital_contexts:
-            LOG.info("{}".format(context))
-
-        for idx,context in enumerate(hirs_ctp_orbital_contexts):
-            hirs_ctp_orbital_prod = hirs_ctp_orbital_comp.dataset('out').product(context)
-            if SPC.exists(hirs_ctp_orbital_prod):
-                task.input('CTPO-{}'.format(idx), hirs_ctp_orbital_prod)
+    def output_filename(self, context):
+        return 'hirs_ctp_daily_{}_{}.nc'.format(context['satellite'],
+                                                context['granule'].strftime('D%y%j'))
 
     def create_ctp_daily(self, inputs, context):
         '''
         Create the CTP statistics for the current day.
         '''
+        with metrics.span('create_ctp_daily', input_bytes=input_bytes(inputs.values())):
+            return self._create_ctp_daily(inputs, context)
+
+    def _create_ctp_daily(self, inputs, context):
 
         rc = 0
 
@@ -175,13 +378,12 @@ class HIRS_CTP_DAILY(Computation):
 
         # Get the required CTP script locations
         hirs_ctp_daily_delivery_id = context['hirs_ctp_daily_delivery_id']
-        delivery = delivered_software.lookup('hirs_ctp_daily', delivery_id=hirs_ctp_daily_delivery_id)
+        delivery = lookup_delivery(hirs_ctp_daily_delivery_id)
         dist_root = pjoin(delivery.path, 'dist')
         version = delivery.version
 
         # Determine the output filenames
-        output_file = 'hirs_ctp_daily_{}_{}.nc'.format(context['satellite'],
-                                                       context['granule'].strftime('D%y%j'))
+        output_file = self.output_filename(context)
         LOG.info("output_file: {}".format(output_file))
 
         # Generating CTP Orbital Input List
@@ -189,23 +391,35 @@ class HIRS_CTP_DAILY(Computation):
         with open(ctp_orbital_file, 'w') as f:
             [f.write('{}\n'.format(basename(input))) for input in inputs.values()]
 
-        # Run the CTP daily binary
+        # Run the CTP daily binary, keeping its stderr to tell transient failures from permanent ones
         ctp_daily_bin = pjoin(dist_root, 'bin/create_daily_daynight_ctps.exe')
-        cmd = '{} {} {}'.format(
+        stderr_file = 'create_daily_daynight_ctps.stderr'
+        cmd = '{} {} {} 2> {}'.format(
                 ctp_daily_bin,
                 ctp_orbital_file,
-                output_file
+                output_file,
+                stderr_file
                 )
         #cmd = 'sleep 0.5; touch {}'.format(output_file)
 
-        try:
-            LOG.debug("cmd = \\\n\t{}".format(cmd.replace(' ',' \\\n\t')))
-            rc_ctp = 0
-            runscript(cmd, [delivery])
-        except CalledProcessError as err:
-            rc_ctp = err.returncode
-            LOG.error(" CTP daily binary {} returned a value of {}".format(ctp_daily_bin, rc_ctp))
-            return rc_ctp, None
+        def run_binary():
+            try:
+                LOG.debug("cmd = \\\n\t{}".format(cmd.replace(' ',' \\\n\t')))
+                with metrics.span('runscript'):
+                    runscript(cmd, [delivery])
+            except CalledProcessError as err:
+                stderr = open(stderr_file).read() if exists(stderr_file) else ''
+                outcome = classify(err.returncode, stderr)
+                LOG.error(" CTP daily binary {} returned a value of {} ({} failure)".format(
+                    ctp_daily_bin, err.returncode, outcome))
+                raise TaskFailure(outcome, 'create_daily_daynight_ctps.exe returned {}: {}'.format(
+                    err.returncode, stderr.strip()[-500:]), err.returncode)
+            finally:
+                if exists(stderr_file) and os.path.getsize(stderr_file) > 0:
+                    LOG.info("create_daily_daynight_ctps.exe stderr:\n{}".format(open(stderr_file).read()))
+
+        run_with_retries(run_binary, attempts=task_attempts, backoff=retry_backoff,
+                         max_backoff=max_retry_backoff)
 
         # Verify output file
         output_file = glob(output_file)
@@ -214,28 +428,305 @@ class HIRS_CTP_DAILY(Computation):
             LOG.debug('Found output CTP daily file "{}"'.format(output_file))
         else:
             LOG.error('Failed to generate "{}", aborting'.format(output_file))
-            rc = 1
-            return rc, None
+            raise TaskFailure(PERMANENT, 'create_daily_daynight_ctps.exe made no output file', 1)
 
         return rc, output_file
 
-    @reraise_as(WorkflowNotReady, FileNotFound, prefix='HIRS_CTP_DAILY')
+    @reraise_as_not_ready
     def run_task(self, inputs, context):
         '''
         Run the CTP Daily binary on a single context
         '''
+        with metrics.span('run_task', **context_fields(context)) as span:
+            # Don't take up a slot for a delivery which keeps failing for this satellite
+            if fail_fast and outcome_ledger is not None and outcome_ledger.is_suspect(
+                    context['satellite'], context['hirs_ctp_daily_delivery_id']):
+                reason = 'hirs_ctp_daily delivery {} keeps failing for {}, not running'.format(
+                    context['hirs_ctp_daily_delivery_id'], context['satellite'])
+                span.set(outcome=SKIPPED)
+                outcome_ledger.record(context, SKIPPED, reason)
+                raise TaskFailure(PERMANENT, reason)
+            try:
+                outputs = self._run_task(inputs, context)
+            except Exception as err:
+                outcome = exception_outcome(err)
+                returncode = getattr(err, 'returncode', None)
+                span.set(outcome=outcome, returncode=returncode)
+                if outcome_ledger is not None:
+                    outcome_ledger.record(context, outcome, '{}: {}'.format(type(err).__name__, err),
+                                          returncode)
+                raise
+            finally:
+                # The staged inputs may be evicted once the task is done with them
+                if staging_cache is not None:
+                    staging_cache.release()
+            span.set(outcome=SUCCESS)
+            if outcome_ledger is not None:
+                outcome_ledger.record(context, SUCCESS)
+            return outputs
+
+    def _run_task(self, inputs, context):
 
         LOG.debug("Running run_task()...")
 
         for key in context.keys():
             LOG.debug("run_task() context['{}'] = {}".format(key, context[key]))
 
-        rc = 0
+        inputs = self._prepare_inputs(inputs)
+        ctp_daily_file = self._make_daily_file(inputs, context)
+
+        self._write_sidecar(ctp_daily_file, context)
+        return {'out': ctp_daily_file}
+
+    def _prepare_inputs(self, inputs):
+        '''
+        Stage the inputs and link them into the working directory.
+        '''
+        # Copy the inputs to local disk, reusing any staged for earlier tasks on this node
+        if staging_cache is not None:
+            with metrics.span('stage_inputs', num_inputs=len(inputs)) as span:
+                inputs = staging_cache.stage_inputs(inputs)
+                span.set(**staging_cache.stats)
 
         # Link the inputs into the working directory
-        inputs = symlink_inputs_to_working_dir(inputs)
+        with metrics.span('symlink_inputs', num_inputs=len(inputs)):
+            return symlink_inputs_to_working_dir(inputs)
+
+    def _make_daily_file(self, inputs, context):
+        '''
+        Return the compressed CTP daily file for the day of context, made from inputs.
+        '''
+        rc = 0
 
-        # Create the CTP daily file for the current day.
+        # Reuse a previous output made from the same inputs with the same software and settings
+        if result_cache is not None:
+            with metrics.span('result_cache') as span:
+                delivery = lookup_delivery(context['hirs_ctp_daily_delivery_id'])
+                key = fingerprint(inputs.values(), context['hirs_ctp_daily_delivery_id'],
+                                  delivery.version, self.output_filename(context),
+                                  compression=compression_settings.cache_key())
+                cached_file = result_cache.fetch(key)
+                span.set(hit=cached_file is not None)
+            if cached_file is not None:
+                return cached_file
+
+        # Create the CTP daily file for the current day; failures raise TaskFailure
         rc, ctp_daily_file = self.create_ctp_daily(inputs, context)
+        if ctp_daily_file is None:
+            raise TaskFailure(PERMANENT, 'No CTP daily file was made (rc={})'.format(rc), rc)
+
+        with metrics.span('compress', codec=compression_settings.codec) as span:
+            stats = {}
+            ctp_daily_file = compress(ctp_daily_file, compression_settings, stats)
+            span.set(**stats)
 
-        return {'out': nc_compress(ctp_daily_file)}
+        if result_cache is not None:
+            result_cache.store(key, ctp_daily_file)
+
+        return ctp_daily_file
+
+    def _write_sidecar(self, ctp_daily_file, context):
+        '''
+        If sidecars are turned on, write the uncompressed, memory-mappable statistics of
+        ctp_daily_file below sidecar_index_root and append them to the satellite's sidecar
+        index, returning the sidecar file, or None if it couldn't be written.
+        '''
+        if sidecar_index_root is None:
+            return None
+
+        with metrics.span('sidecar') as span:
+            try:
+                names, stats = sidecar.read_daily_statistics(ctp_daily_file)
+                sidecar_dir = pjoin(sidecar_index_root, context['satellite'])
+                if not isdir(sidecar_dir):
+                    try:
+                        os.makedirs(sidecar_dir)
+                    except OSError:
+                        if not isdir(sidecar_dir):
+                            raise
+                sidecar_file = sidecar.write_sidecar(sidecar.sidecar_filename(ctp_daily_file, sidecar_dir),
+                                                     stats)
+                index = sidecar.SidecarIndex(sidecar_index_root, context['satellite'])
+                span.set(record=index.append(context['granule'], names, stats))
+            except Exception as err:
+                LOG.warning("Could not write a statistics sidecar for {}: {}".format(ctp_daily_file, err))
+                LOG.debug(traceback.format_exc())
+                span.set(error=str(err))
+                return None
+        return sidecar_file
+
+
+# Most days a HIRS_CTP_DAILY_BLOCK context can cover, one output each
+max_block_days = 31
+
+class HIRS_CTP_DAILY_BLOCK(HIRS_CTP_DAILY):
+    '''
+    HIRS_CTP_DAILY for several consecutive days in one task. The union of the days'
+    CTP Orbital inputs is staged once, and the daily files are made in turn; the
+    file for day idx of the block is the output 'day{idx:02d}', with the same name
+    as HIRS_CTP_DAILY gives it.
+
+    The daily files are products of this computation, not of HIRS_CTP_DAILY, as flo
+    products belong to the computation whose task made them. Blocks start on fixed
+    days of each month, every granularity days from the 1st, so the block covering
+    a day is known from the day alone, and daily_products() finds a day's file
+    whichever of the two computations made it.
+    '''
+
+    parameters = HIRS_CTP_DAILY.parameters + ['days']
+    outputs = ['day{:02d}'.format(idx) for idx in range(max_block_days)]
+
+    def __init__(self, *args, **kwargs):
+        HIRS_CTP_DAILY.__init__(self, *args, **kwargs)
+        self._block_datasets = {}
+
+    def find_contexts(self, time_interval, satellite, hirs2nc_delivery_id, hirs_avhrr_delivery_id,
+                      hirs_csrb_daily_delivery_id, hirs_csrb_monthly_delivery_id,
+                      hirs_ctp_orbital_delivery_id, hirs_ctp_daily_delivery_id, granularity=7):
+        '''
+        Return the blocks of granularity days covering time_interval. A block partly
+        inside time_interval is returned whole.
+        '''
+        if not 1 <= granularity <= max_block_days:
+            raise ValueError('granularity must be from 1 to {} days'.format(max_block_days))
+
+        daily = HIRS_CTP_DAILY.find_contexts(self, time_interval, satellite, hirs2nc_delivery_id,
+                                             hirs_avhrr_delivery_id, hirs_csrb_daily_delivery_id,
+                                             hirs_csrb_monthly_delivery_id, hirs_ctp_orbital_delivery_id,
+                                             hirs_ctp_daily_delivery_id)
+        blocks = {}
+        for day_context in daily:
+            block = self.block_context(day_context, granularity)
+            blocks[block['granule']] = block
+        return [blocks[granule] for granule in sorted(blocks)]
+
+    def block_context(self, day_context, granularity):
+        '''
+        Return the context of the block of granularity days covering the HIRS_CTP_DAILY
+        context day_context. Blocks start every granularity days from the 1st of the
+        month, and the last block of a month ends with it.
+        '''
+        day = day_context['granule']
+        start = day.replace(day=1 + (day.day - 1) // granularity * granularity)
+        month_days = monthrange(day.year, day.month)[1]
+        return dict(day_context, granule=start, days=min(granularity, month_days - start.day + 1))
+
+    def day_contexts(self, context):
+        '''
+        Return the HIRS_CTP_DAILY contexts of the days in the block.
+        '''
+        day_contexts = []
+        for idx in range(context['days']):
+            day_context = dict(context, granule=context['granule'] + timedelta(days=idx))
+            del day_context['days']
+            day_contexts.append(day_context)
+        return day_contexts
+
+    def day_output(self, idx):
+        return 'day{:02d}'.format(idx)
+
+    def block_days(self, context):
+        '''
+        Return the indices of the days of context which have CTP Orbital inputs in the
+        product store; the block only makes these days.
+        '''
+        try:
+            inputs = self._block_inputs(context)
+        except WorkflowNotReady:
+            inputs = []
+        days = set()
+        for _, first, last in inputs:
+            days.update(range(first, last + 1))
+        return sorted(days)
+
+    def block_datasets(self, context):
+        '''
+        Return the datasets of the days of context which have inputs, the same list
+        for blocks making the same days, so those blocks can be ordered together.
+        Days without inputs are left out, so are never ordered.
+        '''
+        days = tuple(self.block_days(context))
+        if len(days) < context['days']:
+            LOG.info("Not ordering {} of the {} days from {}, they have no CTP Orbital inputs".format(
+                context['days'] - len(days), context['days'], context['granule']))
+        if days not in self._block_datasets:
+            self._block_datasets[days] = [self.dataset(self.day_output(idx)) for idx in days]
+        return self._block_datasets[days]
+
+    def _block_inputs(self, context):
+        '''
+        Return a list of (CTP Orbital product, first day, last day) for the distinct
+        orbits in the product store which the days of context use.
+        '''
+        days = [day_context['granule'] for day_context in self.day_contexts(context)]
+        selected = self._find_orbital_contexts(context, days)
+
+        # The boundary orbits of neighbouring days are shared, so each orbit is only
+        # input once, with the first and last day which use it
+        orbits = []
+        first_day = {}
+        last_day = {}
+        for day_idx, orbital_contexts in enumerate(selected):
+            for orbital_context in orbital_contexts:
+                key = orbital_context['granule']
+                if key not in first_day:
+                    first_day[key] = day_idx
+                    orbits.append(orbital_context)
+                last_day[key] = day_idx
+        LOG.info("{} distinct CTP Orbital contexts for the block".format(len(orbits)))
+
+        prods = self.orbital_products(orbits)
+        existing = set([product_key(prod) for prod in self._existing_products(context, prods)])
+        return [(prod, first_day[orbital_context['granule']], last_day[orbital_context['granule']])
+                for orbital_context, prod in zip(orbits, prods) if product_key(prod) in existing]
+
+    def _build_task(self, context, task):
+
+        LOG.debug("Running build_task() for {} days".format(context['days']))
+
+        for idx, (prod, first, last) in enumerate(self._block_inputs(context)):
+            task.input('CTPO-{:04d}-{:02d}-{:02d}'.format(idx, first, last), prod)
+
+    def _run_task(self, inputs, context):
+
+        LOG.debug("Running run_task() for {} days...".format(context['days']))
+
+        # Staged and linked once for the whole block
+        inputs = self._prepare_inputs(inputs)
+
+        outputs = {}
+        for day_idx, day_context in enumerate(self.day_contexts(context)):
+            day_inputs = {}
+            for name, path in inputs.items():
+                first, last = [int(field) for field in name.split('-')[2:]]
+                if first <= day_idx <= last:
+                    day_inputs[name] = path
+            if len(day_inputs) == 0:
+                # block_datasets() left this day out, so it wasn't ordered
+                LOG.info("No CTP Orbital inputs for {}, not making it".format(day_context['granule']))
+                continue
+            with metrics.span('day', day=day_context['granule'].isoformat()):
+                ctp_daily_file = self._make_daily_file(day_inputs, day_context)
+                outputs[self.day_output(day_idx)] = ctp_daily_file
+                self._write_sidecar(ctp_daily_file, day_context)
+
+        return outputs
+
+
+def daily_products(contexts, granularity=1):
+    '''
+    Return, for each HIRS_CTP_DAILY context, a list of the products which may hold
+    its daily file, in order of preference: its 'out' and, if granularity is more
+    than a day, its day of the HIRS_CTP_DAILY_BLOCK of that granularity covering it.
+    '''
+    daily_comp = HIRS_CTP_DAILY()
+    block_comp = HIRS_CTP_DAILY_BLOCK() if granularity > 1 else None
+    products = []
+    for context in contexts:
+        candidates = [daily_comp.dataset('out').product(context)]
+        if block_comp is not None:
+            block = block_comp.block_context(context, granularity)
+            idx = (context['granule'] - block['granule']).days
+            candidates.append(block_comp.dataset(block_comp.day_output(idx)).product(block))
+        products.append(candidates)
+    return products
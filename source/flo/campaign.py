@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Reprocess several satellites in one run, interleaving their submissions
+         to keep the cluster queue full.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import json
+import logging
+from datetime import datetime
+
+from flo.sw.hirs_ctp_daily.orbital_cache import DELIVERY_KEYS
+from flo.sw.hirs_ctp_daily.submission import (monthly_intervals, plan_contexts, prune_existing,
+                                              prune_existing_blocks, batch_contexts)
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+# The satellites a campaign can reprocess
+satellites = ['noaa-06', 'noaa-07', 'noaa-08', 'noaa-09', 'noaa-10', 'noaa-11',
+              'noaa-12', 'noaa-14', 'noaa-15', 'noaa-16', 'noaa-17', 'noaa-18',
+              'noaa-19', 'metop-a', 'metop-b']
+
+# The mission date ranges of the satellites, as (first day, last day); the other
+# satellites' entries must give "start" and "end"
+missions = {
+    'noaa-07': (datetime(1981, 8, 24), datetime(1985, 2, 1)),
+    'noaa-09': (datetime(1985, 2, 25), datetime(1988, 11, 6)),
+    'noaa-19': (datetime(2009, 4, 18), datetime(2018, 1, 31)),
+    'metop-b': (datetime(2013, 5, 20), datetime(2017, 12, 31)),
+}
+
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def load_campaign(filename, delivery_ids):
+    '''
+    Read a campaign table from a JSON file, which holds a list of entries like
+
+        {"satellite": "noaa-19", "start": "2009-04-18", "end": "2017-12-31",
+         "hirs_ctp_daily_delivery_id": "20180802-1"}
+
+    "start" and "end" default to the satellite's entry in missions, and any
+    delivery ids not given are taken from delivery_ids. Raises ValueError for a
+    satellite not in satellites, or one with no date range.
+    '''
+    with open(filename) as f:
+        table = json.load(f)
+
+    entries = []
+    for row in table:
+        satellite = row['satellite']
+        if satellite not in satellites:
+            raise ValueError('Unknown satellite {} in {}, choose from {}'.format(
+                satellite, filename, satellites))
+        start, end = missions.get(satellite, (None, None))
+        if 'start' in row:
+            start = datetime.strptime(row['start'], DATE_FORMAT)
+        if 'end' in row:
+            end = datetime.strptime(row['end'], DATE_FORMAT)
+        if start is None or end is None:
+            raise ValueError('No mission date range known for {}, give its "start" and "end" in {}'.format(
+                satellite, filename))
+
+        entry = dict(delivery_ids)
+        entry.update((key, row[key]) for key in row if key.endswith('_delivery_id'))
+        entry.update({'satellite': satellite, 'start': start, 'end': end})
+        entries.append(entry)
+
+    return entries
+
+
+def interleave(batch_lists):
+    '''
+    Merge several lists of batches round-robin, so that no one list is submitted
+    long after the others.
+    '''
+    merged = []
+    for idx in range(max([len(batches) for batches in batch_lists] + [0])):
+        merged += [batches[idx] for batches in batch_lists if idx < len(batches)]
+    return merged
+
+
+def plan_campaign(comp, entries, batch_size, incremental=True, granularity=1, daily_comp=None):
+    '''
+    Return the interleaved batches of contexts for every entry of the campaign. If
+    incremental, contexts whose output already exists are left out. If granularity
+    is more than a day, comp is a HIRS_CTP_DAILY_BLOCK, and a block is only left out
+    once all its days exist, as its own outputs or as those of daily_comp.
+    '''
+    batch_lists = []
+    for entry in entries:
+        args = [entry[key] for key in DELIVERY_KEYS + ['hirs_ctp_daily_delivery_id']]
+        if granularity > 1:
+            args.append(granularity)
+        contexts = plan_contexts(comp, monthly_intervals(entry['start'], entry['end']),
+                                 entry['satellite'], *args)
+        LOG.info("{}: {} contexts from {} to {}".format(
+            entry['satellite'], len(contexts), entry['start'].date(), entry['end'].date()))
+        if incremental and granularity > 1:
+            contexts = prune_existing_blocks(comp, daily_comp, contexts)
+        elif incremental:
+            contexts = prune_existing(comp, contexts)
+        batch_lists.append(batch_contexts(contexts, batch_size))
+    return interleave(batch_lists)
+
+
+def throughput(records):
+    '''
+    Summarize submission ledger records per satellite, returning a dict of
+    satellite -> {'contexts', 'jobs', 'failed_batches', 'elapsed', 'contexts_per_second'},
+    where elapsed runs from the start of a satellite's first batch to the end of its last.
+    '''
+    summary = {}
+    for record in records:
+        stats = summary.setdefault(record['satellite'], {
+            'contexts': 0, 'jobs': 0, 'failed_batches': 0,
+            'start': record['start'], 'end': record['end']})
+        stats['contexts'] += record['num_contexts']
+        stats['jobs'] += len(record['job_numbers'])
+        stats['failed_batches'] += record['status'] == 'failed'
+        stats['start'] = min(stats['start'], record['start'])
+        stats['end'] = max(stats['end'], record['end'])
+
+    for stats in summary.values():
+        stats['elapsed'] = stats.pop('end') - stats.pop('start')
+        stats['contexts_per_second'] = (stats['contexts'] / stats['elapsed']
+                                        if stats['elapsed'] > 0 else 0.)
+    return summary
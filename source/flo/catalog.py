@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Existence checks and file lookups around StoredProductCatalog, remembered
+         for the life of the process.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import logging
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+
+def product_key(product):
+    '''
+    Return a dictionary key for a product, falling back to its repr if it isn't hashable.
+    '''
+    try:
+        hash(product)
+        return product
+    except TypeError:
+        return repr(product)
+
+
+class CachedProductCatalog(object):
+    '''
+    Answer existence and file queries for a list of products.
+
+    StoredProductCatalog has no query for many products, so each distinct product
+    still costs one exists() call, and one file() call if resolved, the first time
+    it's asked for. Products found to exist (and their file records) are then
+    remembered for the life of the process, so the edge orbits shared by
+    consecutive days, or products asked for again by a long-running planner, cost
+    no further catalog calls. Missing products are re-checked on every call, as
+    they may land at any time. A process which looks up each product once, such
+    as a single-day task, saves nothing.
+
+    stats['requested'] counts the lookups the one-product-at-a-time pattern
+    (exists(), then file() for products that exist) would have made, and
+    stats['lookups'] the ones actually made, so stats['saved'] is their difference.
+    '''
+
+    def __init__(self, catalog=None):
+        self._catalog = catalog
+        self._files = {}
+        self.stats = {'requested': 0, 'lookups': 0, 'saved': 0}
+
+    @property
+    def catalog(self):
+        if self._catalog is None:
+            from flo.product import StoredProductCatalog
+            self._catalog = StoredProductCatalog()
+        return self._catalog
+
+    def clear(self):
+        self._files.clear()
+
+    def lookup(self, products, resolve=False):
+        '''
+        Return (presence, files) for the products, where presence maps each product
+        key to True/False and files maps the keys of existing products to their
+        StoredProductCatalog file records (or None unless resolve is True).
+        '''
+        presence = {}
+        files = {}
+        requested = 0
+        lookups = 0
+
+        for product in products:
+            key = product_key(product)
+            requested += 1
+            if key in presence:
+                if presence[key] and resolve:
+                    requested += 1
+                continue
+
+            if key not in self._files:
+                lookups += 1
+                if not self.catalog.exists(product):
+                    presence[key] = False
+                    continue
+                self._files[key] = None
+
+            presence[key] = True
+            if resolve:
+                requested += 1
+                if self._files[key] is None:
+                    lookups += 1
+                    self._files[key] = self.catalog.file(product)
+            files[key] = self._files[key]
+
+        self.stats['requested'] += requested
+        self.stats['lookups'] += lookups
+        self.stats['saved'] = self.stats['requested'] - self.stats['lookups']
+        LOG.debug("Looked up {} products with {} catalog calls ({} saved so far)".format(
+            len(presence), lookups, self.stats['saved']))
+
+        return presence, files
+
+    def exists(self, products):
+        '''
+        Return the subset of products which exist, preserving their order.
+        '''
+        presence, _ = self.lookup(products)
+        return [product for product in products if presence[product_key(product)]]
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Configurable netCDF compression stage for the hirs_ctp_daily outputs.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import logging
+import time
+from os.path import getsize
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+# Codecs other than these are passed to netCDF4 as compression=<codec> (netCDF4 >= 1.6)
+GLUTIL = 'glutil'
+NONE = 'none'
+ZLIB = 'zlib'
+
+
+class CompressionSettings(object):
+    '''
+    How to compress an output file.
+
+    codec: 'glutil' to use glutil.nc_compress, 'none' to leave the file alone,
+           'zlib', or any other codec name netCDF4 accepts as compression=...
+    level: deflate/complevel, 1-9
+    shuffle: whether to apply the HDF5 byte shuffle filter
+    chunks: dict of dimension name -> chunk length, or None for the library default
+    skip_compressed: leave files whose variables are all compressed already alone
+    '''
+
+    def __init__(self, codec=GLUTIL, level=4, shuffle=True, chunks=None, skip_compressed=True):
+        self.codec = codec
+        self.level = level
+        self.shuffle = shuffle
+        self.chunks = chunks
+        self.skip_compressed = skip_compressed
+
+    def __repr__(self):
+        return 'CompressionSettings(codec={}, level={}, shuffle={}, chunks={})'.format(
+            self.codec, self.level, self.shuffle, self.chunks)
+
+    def cache_key(self):
+        '''
+        Return a string of the settings which change the compressed file.
+        '''
+        chunks = ';'.join(['{}:{}'.format(dim, size) for dim, size in sorted((self.chunks or {}).items())])
+        return 'codec={},level={},shuffle={},chunks={},skip_compressed={}'.format(
+            self.codec, self.level, int(self.shuffle), chunks, int(self.skip_compressed))
+
+    @classmethod
+    def from_string(cls, text):
+        '''
+        Parse settings like "codec=zlib,level=6,shuffle=1,chunks=latitude:90;longitude:180".
+        '''
+        kwargs = {}
+        for item in [item for item in text.split(',') if item.strip()]:
+            key, value = [part.strip() for part in item.split('=', 1)]
+            if key == 'level':
+                value = int(value)
+            elif key in ('shuffle', 'skip_compressed'):
+                value = value.lower() in ('1', 'true', 'yes')
+            elif key == 'chunks':
+                value = dict((dim, int(size)) for dim, size in
+                             [chunk.split(':') for chunk in value.split(';')])
+            elif key != 'codec':
+                raise ValueError('Unknown compression setting {}'.format(key))
+            kwargs[key] = value
+        return cls(**kwargs)
+
+    def variable_kwargs(self, variable):
+        '''
+        Return the createVariable() keyword arguments to compress variable with.
+        '''
+        kwargs = {'shuffle': self.shuffle, 'complevel': self.level}
+        if self.codec == ZLIB:
+            kwargs['zlib'] = True
+        else:
+            kwargs['compression'] = self.codec
+        if self.chunks is not None and variable.ndim > 0:
+            kwargs['chunksizes'] = [max(1, min(self.chunks.get(dim, length), length))
+                                    for dim, length in zip(variable.dimensions, variable.shape)]
+        return kwargs
+
+
+def is_compressed(filename):
+    '''
+    Return True if every non-scalar variable of filename has a compression filter.
+    '''
+    from netCDF4 import Dataset
+
+    with Dataset(filename) as ds:
+        for variable in ds.variables.values():
+            if variable.ndim == 0:
+                continue
+            filters = variable.filters() or {}
+            if not any([value for key, value in filters.items()
+                        if key not in ('shuffle', 'fletcher32', 'complevel')]):
+                return False
+    return True
+
+
+def output_format(file_format):
+    '''
+    Return the format to write a compressed copy of a file of file_format in. netCDF3
+    files can't hold compressed variables, so are written as NETCDF4_CLASSIC, which
+    keeps their data model.
+    '''
+    if file_format.startswith('NETCDF3'):
+        return 'NETCDF4_CLASSIC'
+    return file_format
+
+
+def _copy_file(filename, tmp_filename, settings):
+    '''
+    Copy filename to tmp_filename, compressing every variable.
+    '''
+    from netCDF4 import Dataset
+
+    with Dataset(filename) as src, Dataset(tmp_filename, 'w', format=output_format(src.file_format)) as dst:
+        dst.setncatts(dict((name, src.getncattr(name)) for name in src.ncattrs()))
+        for name, dim in src.dimensions.items():
+            dst.createDimension(name, None if dim.isunlimited() else len(dim))
+
+        for name, var in src.variables.items():
+            attrs = dict((attr, var.getncattr(attr)) for attr in var.ncattrs())
+            fill_value = attrs.pop('_FillValue', None)
+            kwargs = settings.variable_kwargs(var) if var.ndim > 0 else {}
+            out = dst.createVariable(name, var.datatype, var.dimensions, fill_value=fill_value,
+                                     **kwargs)
+            out.setncatts(attrs)
+            var.set_auto_maskandscale(False)
+            out.set_auto_maskandscale(False)
+            out[...] = var[...]
+
+
+def compress(filename, settings=None, stats=None):
+    '''
+    Compress filename in place according to settings, returning the path of the
+    compressed file and logging the bytes in and out and the time taken. If stats
+    is a dict, those numbers are also stored in it.
+    '''
+    settings = CompressionSettings() if settings is None else settings
+    start = time.time()
+    bytes_in = getsize(filename)
+
+    if settings.codec == NONE:
+        output_file = filename
+    elif settings.codec == GLUTIL:
+        from glutil import nc_compress
+        output_file = nc_compress(filename)
+    elif settings.skip_compressed and is_compressed(filename):
+        LOG.info("{} is already compressed, skipping".format(filename))
+        output_file = filename
+    else:
+        tmp_filename = filename + '.compressing'
+        try:
+            _copy_file(filename, tmp_filename, settings)
+            os.rename(tmp_filename, filename)
+        finally:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+        output_file = filename
+
+    elapsed = time.time() - start
+    bytes_out = getsize(output_file)
+    LOG.info("Compressed {} with {}: {} -> {} bytes ({:.1f}%) in {:.2f}s".format(
+        filename, settings, bytes_in, bytes_out, 100. * bytes_out / max(bytes_in, 1), elapsed))
+    if stats is not None:
+        stats.update({'bytes_in': bytes_in, 'bytes_out': bytes_out, 'elapsed': elapsed})
+
+    return output_file
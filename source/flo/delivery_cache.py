@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Process- and node-level cache of resolved software deliveries, so that short
+         tasks don't pay for a delivered_software lookup each time they run.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import pickle
+import hashlib
+import logging
+import tempfile
+from os.path import exists, isdir, join as pjoin
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+
+def delivery_signature(path):
+    '''
+    Return the modification times of a delivery's directory and of its dist
+    directory, which change when the delivery is redeployed; or None if it's gone.
+    '''
+    signature = []
+    for directory in [path, pjoin(path, 'dist')]:
+        try:
+            signature.append(os.stat(directory).st_mtime)
+        except OSError:
+            if directory == path:
+                return None
+            signature.append(None)
+    return signature
+
+
+class DeliveryCache(object):
+    '''
+    Deliveries returned by lookup(name, delivery_id), kept for the life of the process
+    and, if cache_dir is given, pickled there for the other tasks on the node.
+
+    An entry is only used while the delivery's path still exists with the modification
+    times it had when the entry was made. source is set to where the last delivery
+    came from: 'process', 'node' or 'lookup'.
+    '''
+
+    def __init__(self, lookup, cache_dir=None):
+        self.lookup = lookup
+        self.cache_dir = cache_dir
+        self.deliveries = {}
+        self.source = None
+        self.stats = {'process_hits': 0, 'node_hits': 0, 'lookups': 0, 'stale': 0}
+
+    def _node_file(self, name, delivery_id):
+        key = hashlib.sha1('{} {}'.format(name, delivery_id).encode('utf-8')).hexdigest()[:16]
+        return pjoin(self.cache_dir, '{}-{}.pickle'.format(name, key))
+
+    def _valid(self, entry):
+        delivery, signature = entry
+        return signature is not None and delivery_signature(delivery.path) == signature
+
+    def _read_node(self, name, delivery_id):
+        node_file = self._node_file(name, delivery_id)
+        if not exists(node_file):
+            return None
+        try:
+            with open(node_file, 'rb') as f:
+                entry = pickle.load(f)
+        except Exception as err:
+            LOG.warning("Ignoring unreadable delivery cache {}: {}".format(node_file, err))
+            return None
+        return entry if entry[0] == (name, delivery_id) else None
+
+    def _write_node(self, name, delivery_id, entry):
+        try:
+            if not isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(((name, delivery_id),) + entry, f, protocol=2)
+            os.rename(tmp_file, self._node_file(name, delivery_id))
+        except (EnvironmentError, pickle.PicklingError) as err:
+            LOG.warning("Could not cache delivery {} {} in {}: {}".format(
+                name, delivery_id, self.cache_dir, err))
+
+    def get(self, name, delivery_id):
+        '''
+        Return the delivery of name with delivery_id, looking it up only if there's no
+        valid cached entry.
+        '''
+        key = (name, delivery_id)
+        entry = self.deliveries.get(key)
+        if entry is not None and self._valid(entry):
+            self.stats['process_hits'] += 1
+            self.source = 'process'
+            return entry[0]
+
+        if self.cache_dir is not None:
+            node_entry = self._read_node(name, delivery_id)
+            if node_entry is not None:
+                entry = node_entry[1:]
+                if self._valid(entry):
+                    self.deliveries[key] = entry
+                    self.stats['node_hits'] += 1
+                    self.source = 'node'
+                    return entry[0]
+                self.stats['stale'] += 1
+                LOG.info("Cached delivery {} {} has changed, looking it up again".format(name, delivery_id))
+
+        delivery = self.lookup(name, delivery_id)
+        entry = (delivery, delivery_signature(delivery.path))
+        self.deliveries[key] = entry
+        self.stats['lookups'] += 1
+        self.source = 'lookup'
+        if self.cache_dir is not None and entry[1] is not None:
+            self._write_node(name, delivery_id, entry)
+        return delivery
+
+    def clear(self):
+        self.deliveries.clear()
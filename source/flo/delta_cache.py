@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Process-wide cache of lazily loaded DeltaCatalogs, keyed by their input
+         sources and the modification times of the data lists.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import json
+import types
+import logging
+import threading
+from collections import OrderedDict
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+# The DeltaCatalog methods whose results are memoized: the queries the hirs2nc family of
+# computations make, delta_catalog.file(sensor, satellite, file_type, granule) and
+# delta_catalog.files(sensor, satellite, file_type, interval), which only read the parsed
+# data lists. Any other attribute is passed straight through to the catalog. A catalog
+# lacking one of them raises TypeError when loaded, rather than going unmemoized.
+memoized_methods = ['file', 'files']
+
+# Most results memoized per catalog, least recently used dropped first
+max_memoized = 4096
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except (OSError, TypeError):
+        return None
+
+
+class LazyDeltaCatalog(object):
+    '''
+    Stands in for a DeltaCatalog, which is only built, and its data lists parsed,
+    when first used. The results of the query methods in memoized_methods are
+    memoized by their arguments, up to max_memoized of them, so repeated lookups for
+    the same times are answered without rescanning the lists. List results are
+    copied on the way out, and generators aren't memoized.
+    '''
+
+    def __init__(self, factory, input_locations, max_results=None):
+        self._factory = factory
+        self._input_locations = input_locations
+        self._catalog = None
+        self._results = OrderedDict()
+        self._max_results = max_memoized if max_results is None else max_results
+        self._lock = threading.RLock()
+        self.stats = {'loads': 0, 'calls': 0, 'hits': 0}
+
+    @property
+    def catalog(self):
+        with self._lock:
+            if self._catalog is None:
+                LOG.info("Loading DeltaCatalog for {}".format(self._input_locations.get('input_data')))
+                catalog = self._factory(self._input_locations)
+                missing = [name for name in memoized_methods if not callable(getattr(catalog, name, None))]
+                if missing:
+                    raise TypeError('{} has no {} method, which memoized_methods lists'.format(
+                        type(catalog).__name__, ', '.join(missing)))
+                self._catalog = catalog
+                self.stats['loads'] += 1
+            return self._catalog
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        attr = getattr(self.catalog, name)
+        if name not in memoized_methods or not callable(attr):
+            return attr
+
+        def memoized(*args, **kwargs):
+            key = (name, repr(args), repr(sorted(kwargs.items())))
+            with self._lock:
+                self.stats['calls'] += 1
+                if key in self._results:
+                    self.stats['hits'] += 1
+                    result = self._results.pop(key)
+                    self._results[key] = result
+                    return list(result) if isinstance(result, list) else result
+            result = attr(*args, **kwargs)
+            if isinstance(result, types.GeneratorType):
+                return result
+            with self._lock:
+                self._results[key] = list(result) if isinstance(result, list) else result
+                while len(self._results) > self._max_results:
+                    self._results.popitem(last=False)
+            return result
+
+        return memoized
+
+
+class DeltaCatalogCache(object):
+    '''
+    Hands out one LazyDeltaCatalog per set of input sources. A catalog is rebuilt if
+    any of its data list files has been modified since it was made, and on_reload,
+    if given, is then called with the input sources, e.g. to drop what was found
+    with the old lists.
+    '''
+
+    def __init__(self, factory, on_reload=None):
+        self._factory = factory
+        self._on_reload = on_reload
+        self._catalogs = {}
+        self._lock = threading.Lock()
+
+    def key(self, input_locations):
+        '''
+        Return (locations key, data list mtimes) for input_locations.
+        '''
+        locations = json.dumps(input_locations, sort_keys=True, default=str)
+        mtimes = tuple(_mtime(path) for _, path in
+                       sorted(input_locations.get('input_data', {}).items()))
+        return locations, mtimes
+
+    def get(self, input_locations):
+        locations, mtimes = self.key(input_locations)
+        reloaded = False
+        with self._lock:
+            cached = self._catalogs.get(locations)
+            if cached is None or cached[0] != mtimes:
+                if cached is not None:
+                    LOG.info("Data lists have changed, reloading the DeltaCatalog")
+                    reloaded = True
+                self._catalogs[locations] = (mtimes, LazyDeltaCatalog(self._factory, input_locations))
+            catalog = self._catalogs[locations][1]
+        if reloaded and self._on_reload is not None:
+            self._on_reload(input_locations)
+        return catalog
+
+    def clear(self):
+        with self._lock:
+            self._catalogs.clear()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Lightweight per-phase timing and resource metrics, written as JSON lines.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import json
+import logging
+import resource
+import socket
+import threading
+import time
+from os.path import exists, getsize
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+
+def input_bytes(paths):
+    '''
+    Return the total size of the existing files in paths.
+    '''
+    return sum([getsize(path) for path in paths if exists(path)])
+
+
+class Span(object):
+    '''
+    Times a phase of a task. Used as a context manager; on exit one record is
+    written with the wall time, the CPU time of this process and of its finished
+    child processes, and the peak RSS (in kB) of each, along with any fields given
+    or set().
+    '''
+
+    def __init__(self, metrics, name, fields):
+        self.metrics = metrics
+        self.name = name
+        self.fields = fields
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        if self.metrics.filename is None:
+            return self
+        stack = self.metrics._stack()
+        self.path = '/'.join([span.name for span in stack] + [self.name])
+        stack.append(self)
+        self.start = time.time()
+        self.self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        self.child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.metrics.filename is None:
+            return False
+        end = time.time()
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.metrics._stack().pop()
+
+        record = {'span': self.path,
+                  'start': self.start,
+                  'wall_time': end - self.start,
+                  'cpu_time': (self_usage.ru_utime - self.self_usage.ru_utime +
+                               self_usage.ru_stime - self.self_usage.ru_stime),
+                  'child_cpu_time': (child_usage.ru_utime - self.child_usage.ru_utime +
+                                     child_usage.ru_stime - self.child_usage.ru_stime),
+                  'max_rss': self_usage.ru_maxrss,
+                  'child_max_rss': child_usage.ru_maxrss,
+                  'status': 'ok' if exc_type is None else exc_type.__name__}
+        record.update(self.fields)
+        self.metrics.write(record)
+        return False
+
+
+class Metrics(object):
+    '''
+    Writes span records to filename as JSON lines, tagged with the host and the pid
+    of the process writing them. If filename is None, spans record nothing.
+    '''
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._host = socket.gethostname()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def span(self, name, **fields):
+        return Span(self, name, fields)
+
+    def write(self, record):
+        if self.filename is None:
+            return
+        # Read the pid for each record, as forked worker processes share this object
+        record.update({'host': self._host, 'pid': os.getpid()})
+        line = json.dumps(record, default=str, sort_keys=True)
+        with self._lock:
+            try:
+                with open(self.filename, 'a') as f:
+                    f.write(line + '\n')
+            except IOError as err:
+                LOG.warning("Could not write metrics to {}: {}".format(self.filename, err))
+
+
+def context_fields(context):
+    '''
+    Return the fields identifying a hirs_ctp_daily context in a metrics record.
+    '''
+    return {'satellite': context['satellite'], 'granule': context['granule'].isoformat()}
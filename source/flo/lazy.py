@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Deferred imports, so that importing hirs_ctp_daily for planning doesn't load
+         numpy, glutil, sipsprod and the other computations until they are used.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import functools
+import importlib
+import logging
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+
+class LazyObject(object):
+    '''
+    Stands in for module, or for its attribute name, importing it on first use.
+    Attribute access, attribute assignment and calls are passed through.
+    '''
+
+    def __init__(self, module, name=None):
+        object.__setattr__(self, '_module', module)
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_target', None)
+
+    def _resolve(self):
+        target = object.__getattribute__(self, '_target')
+        if target is None:
+            LOG.debug("Importing {} on first use".format(self._module))
+            target = importlib.import_module(self._module)
+            if self._name is not None:
+                target = getattr(target, self._name)
+            object.__setattr__(self, '_target', target)
+        return target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return '<lazy {}>'.format(self._module if self._name is None
+                                  else '{}.{}'.format(self._module, self._name))
+
+
+def deferred_decorator(factory):
+    '''
+    Decorate a function with the decorator returned by factory(), which is only
+    called (and whatever it needs imported) the first time the function is.
+    '''
+    def decorator(function):
+        decorated = []
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not decorated:
+                decorated.append(factory()(function))
+            return decorated[0](*args, **kwargs)
+
+        return wrapper
+    return decorator
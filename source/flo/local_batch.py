@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Run local_prepare()/local_execute() for many contexts at once, each in its
+         own scratch directory, from a pool of worker processes.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import json
+import logging
+import stat
+import time
+import traceback
+from multiprocessing import Pool
+from os.path import exists, isdir, islink, join as pjoin
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+
+def context_dir_name(idx, context):
+    return '{:04d}_{}_{}'.format(idx, context['satellite'], context['granule'].strftime('%Y%m%d'))
+
+
+def share_inputs(inputs_dir, staged_dir):
+    '''
+    Move the files prepared in inputs_dir into staged_dir, keeping one read-only copy
+    of each input shared by all contexts, and symlink them back into inputs_dir.
+    Returns the number of prepared files which were already staged.
+    '''
+    shared = 0
+    for name in sorted(os.listdir(inputs_dir)):
+        path = pjoin(inputs_dir, name)
+        if islink(path) or isdir(path):
+            continue
+        staged = pjoin(staged_dir, name)
+        if exists(staged):
+            os.remove(path)
+            shared += 1
+        else:
+            os.rename(path, staged)
+            os.chmod(staged, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.symlink(staged, path)
+    return shared
+
+
+def _run_context(args):
+    '''
+    Prepare and execute a single context in its scratch directory. Runs in a worker
+    process, so changing directory doesn't affect the other contexts.
+    '''
+    idx, context, setup, scratch_root, skip_prepare, skip_execute = args
+
+    from flo.ui import local_prepare, local_execute
+    import flo.sw.hirs_ctp_orbital as hirs_ctp_orbital
+
+    work_dir = pjoin(scratch_root, context_dir_name(idx, context))
+    staged_dir = pjoin(scratch_root, 'staged')
+    result = {'index': idx, 'context': context, 'work_dir': work_dir, 'status': 'success',
+              'error': None, 'prepare_time': 0., 'execute_time': 0., 'shared_inputs': 0,
+              'outputs': []}
+
+    current_dir = os.getcwd()
+    try:
+        if not isdir(work_dir):
+            os.makedirs(work_dir)
+        os.chdir(work_dir)
+
+        comp = setup(context['satellite'])
+        hirs_ctp_orbital_comp = hirs_ctp_orbital.HIRS_CTP_ORBITAL()
+
+        if not skip_prepare:
+            start = time.time()
+            local_prepare(comp, context, download_onlies=[hirs_ctp_orbital_comp])
+            result['shared_inputs'] = share_inputs('inputs', staged_dir)
+            result['prepare_time'] = time.time() - start
+        if not skip_execute:
+            start = time.time()
+            local_execute(comp, context, download_onlies=[hirs_ctp_orbital_comp])
+            result['execute_time'] = time.time() - start
+            if isdir('outputs'):
+                result['outputs'] = sorted(os.listdir('outputs'))
+    except Exception:
+        LOG.debug(traceback.format_exc())
+        result['status'] = 'failed'
+        result['error'] = traceback.format_exc().splitlines()[-1]
+    finally:
+        os.chdir(current_dir)
+
+    return result
+
+
+class LocalBatchRunner(object):
+    '''
+    Run contexts locally, at most workers at a time, each in a scratch directory
+    below scratch_root. Inputs prepared for one context are moved into a shared,
+    read-only scratch_root/staged directory and symlinked into each context's
+    inputs directory.
+
+    setup(satellite) must return the computation, having set up its input sources;
+    it is called in the worker processes, so must be a module level function.
+    '''
+
+    def __init__(self, setup, workers=4, scratch_root='.'):
+        self.setup = setup
+        self.workers = workers
+        self.scratch_root = os.path.abspath(scratch_root)
+
+    def run(self, contexts, skip_prepare=False, skip_execute=False, report=None):
+        '''
+        Run the contexts, returning a list of per-context results. If report is given,
+        the results and a summary are also written there as JSON.
+        '''
+        staged_dir = pjoin(self.scratch_root, 'staged')
+        if not isdir(staged_dir):
+            os.makedirs(staged_dir)
+
+        jobs = [(idx, context, self.setup, self.scratch_root, skip_prepare, skip_execute)
+                for idx, context in enumerate(contexts)]
+
+        start = time.time()
+        pool = Pool(self.workers)
+        try:
+            results = []
+            for result in pool.imap_unordered(_run_context, jobs):
+                LOG.info("Context {index} {status} (prepare {prepare_time:.1f}s, "
+                         "execute {execute_time:.1f}s): {context}".format(**result))
+                if result['error'] is not None:
+                    LOG.error(result['error'])
+                results.append(result)
+        finally:
+            pool.close()
+            pool.join()
+        elapsed = time.time() - start
+
+        results.sort(key=lambda result: result['index'])
+        summary = {'contexts': len(results),
+                   'failed': len([r for r in results if r['status'] != 'success']),
+                   'workers': self.workers,
+                   'elapsed': elapsed,
+                   'serial_time': sum([r['prepare_time'] + r['execute_time'] for r in results])}
+        LOG.info("Ran {contexts} contexts ({failed} failed) in {elapsed:.1f}s with {workers} "
+                 "workers, {serial_time:.1f}s of serial work".format(**summary))
+
+        if report is not None:
+            with open(report, 'w') as f:
+                json.dump({'summary': summary, 'results': results}, f, default=str,
+                          indent=2, sort_keys=True)
+
+        return results
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Mission plan manifests: the CTP Orbital granules and expected output of every
+         day of a satellite, planned once and written as a sorted, tab-separated table
+         which submission and build_task() can use instead of querying the catalogs.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+from flo.sw.hirs_ctp_daily.catalog import CachedProductCatalog, product_key
+from flo.sw.hirs_ctp_daily.orbital_cache import DELIVERY_KEYS
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+COLUMNS = ['day', 'satellite', 'orbital_granules', 'output', 'digest']
+
+# The delivery ids a manifest was planned with, written in its header
+HEADER_KEYS = DELIVERY_KEYS + ['hirs_ctp_daily_delivery_id']
+
+DAY_FORMAT = '%Y-%m-%d'
+GRANULE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def row_digest(row):
+    '''
+    Return a short digest of the inputs and output of a manifest row.
+    '''
+    text = '\t'.join([','.join(row['orbital_granules']), row['output']])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def parse_granule(text):
+    return datetime.strptime(text, GRANULE_FORMAT + '.%f' if '.' in text else GRANULE_FORMAT)
+
+
+class Manifest(object):
+    '''
+    The planned rows of one set of delivery ids, looked up by (satellite, day).
+    Each row holds the granules of the day's CTP Orbital contexts (boundary orbits
+    included) and the expected output filename. The products themselves are found
+    from the contexts, as flo resolves any task input.
+    '''
+
+    def __init__(self, delivery_ids, rows=()):
+        self.delivery_ids = dict((key, delivery_ids[key]) for key in HEADER_KEYS)
+        self.rows = {}
+        for row in rows:
+            self.add(row)
+
+    def add(self, row):
+        row = dict(row)
+        row['digest'] = row_digest(row)
+        self.rows[(row['satellite'], row['day'])] = row
+
+    def __len__(self):
+        return len(self.rows)
+
+    @staticmethod
+    def days(context):
+        return [context['granule'] + timedelta(days=idx) for idx in range(context.get('days', 1))]
+
+    def get(self, satellite, day):
+        return self.rows.get((satellite, day.strftime(DAY_FORMAT)))
+
+    def covers(self, context):
+        '''
+        Return whether every day of context was planned with the deliveries of context.
+        '''
+        if any(context[key] != value for key, value in self.delivery_ids.items()):
+            return False
+        return all(self.get(context['satellite'], day) is not None for day in self.days(context))
+
+    def orbital_contexts(self, context):
+        '''
+        Return a list of the planned CTP Orbital contexts of each day of context.
+        '''
+        base = dict((key, context[key]) for key in DELIVERY_KEYS)
+        base['satellite'] = context['satellite']
+        return [[dict(base, granule=parse_granule(granule))
+                 for granule in self.get(context['satellite'], day)['orbital_granules']]
+                for day in self.days(context)]
+
+    def contexts(self, satellite, first=None, last=None):
+        '''
+        Return the daily contexts of the planned days of satellite from first to last.
+        '''
+        contexts = []
+        for sat, day in sorted(self.rows):
+            day = datetime.strptime(day, DAY_FORMAT)
+            if sat != satellite or (first is not None and day < first) or (last is not None and day > last):
+                continue
+            context = dict(self.delivery_ids, satellite=satellite, granule=day)
+            contexts.append(context)
+        return contexts
+
+    def write(self, filename):
+        tmp_file = filename + '.tmp'
+        with open(tmp_file, 'w') as f:
+            for key in HEADER_KEYS:
+                f.write('# {}={}\n'.format(key, self.delivery_ids[key]))
+            f.write('\t'.join(COLUMNS) + '\n')
+            for key in sorted(self.rows):
+                row = self.rows[key]
+                f.write('\t'.join([row['day'], row['satellite'], ','.join(row['orbital_granules']),
+                                   row['output'], row['digest']]) + '\n')
+        os.rename(tmp_file, filename)
+
+    @classmethod
+    def read(cls, filename):
+        delivery_ids = {}
+        rows = []
+        columns = COLUMNS
+        with open(filename) as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if line.startswith('#'):
+                    key, value = line[1:].strip().split('=', 1)
+                    delivery_ids[key] = value
+                    continue
+                fields = line.split('\t')
+                if fields[0] == COLUMNS[0]:
+                    # Earlier manifests have other columns too, e.g. input_paths
+                    columns = fields
+                    continue
+                row = dict((column, value) for column, value in zip(columns, fields)
+                           if column in COLUMNS)
+                row['orbital_granules'] = row['orbital_granules'].split(',') if row['orbital_granules'] else []
+                rows.append(row)
+        manifest = cls(delivery_ids, rows)
+        LOG.info("Read {} planned days from {}".format(len(manifest), filename))
+        return manifest
+
+
+def plan_manifest(comp, contexts, catalog=None):
+    '''
+    Return a Manifest of contexts, selecting each day's CTP Orbital inputs as build_task()
+    does. Days without any inputs are left out.
+    '''
+    from flo.builder import WorkflowNotReady
+
+    catalog = CachedProductCatalog() if catalog is None else catalog
+    manifest = Manifest(contexts[0] if contexts else dict((key, '') for key in HEADER_KEYS))
+    for context in contexts:
+        try:
+            orbital_contexts = comp.orbital_contexts(context)
+        except WorkflowNotReady:
+            LOG.info("No CTP Orbital inputs for {}".format(context['granule'].date()))
+            continue
+        products = comp.orbital_products(orbital_contexts)
+        presence, _ = catalog.lookup(products)
+        planned = [orbital_context for orbital_context, product in zip(orbital_contexts, products)
+                   if presence[product_key(product)]]
+        if not planned:
+            continue
+        manifest.add({'day': context['granule'].strftime(DAY_FORMAT),
+                      'satellite': context['satellite'],
+                      'orbital_granules': [orbital_context['granule'].isoformat()
+                                           for orbital_context in planned],
+                      'output': comp.output_filename(context)})
+    LOG.info("Planned {} of {} days".format(len(manifest), len(contexts)))
+    return manifest
+
+
+def diff_manifests(old, new):
+    '''
+    Return a dict of the (satellite, day) keys added, removed and changed from old to new.
+    '''
+    return {'added': sorted(set(new.rows) - set(old.rows)),
+            'removed': sorted(set(old.rows) - set(new.rows)),
+            'changed': sorted([key for key in set(old.rows) & set(new.rows)
+                               if old.rows[key]['digest'] != new.rows[key]['digest']])}
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Nominal orbit geometry of the HIRS satellites, and a planner which sizes the
+         CTP Orbital query around a day from it, rather than from a fixed padding.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import logging
+from datetime import timedelta
+
+from timeutil import TimeInterval
+
+from flo.sw.hirs_ctp_daily.timeline import OrbitalTimeline, to_datetime64
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+# Nominal orbital period of each satellite, in minutes. Satellites not listed get
+# default_orbit_period.
+orbit_periods = {'noaa-06': 101.2, 'noaa-07': 101.8, 'noaa-08': 101.4, 'noaa-09': 101.9,
+                 'noaa-10': 101.3, 'noaa-11': 102.0, 'noaa-12': 101.3, 'noaa-14': 102.0,
+                 'noaa-15': 101.1, 'noaa-16': 102.1, 'noaa-17': 101.2, 'noaa-18': 102.1,
+                 'noaa-19': 102.1, 'metop-a': 101.3, 'metop-b': 101.4}
+default_orbit_period = 102.0
+
+# Known outages of each satellite's data, as (start, end) datetimes. No orbit is expected
+# to start inside them, so the planner widens its query straight past them.
+known_gaps = {}
+
+# Allowance for the scatter of the orbit start times about the nominal period, in minutes
+period_slack = 5.
+
+
+class OrbitGeometry(object):
+    '''
+    The nominal period and known gaps of a satellite's orbits.
+    '''
+
+    def __init__(self, satellite, period=None, gaps=None):
+        self.satellite = satellite
+        self.period = timedelta(minutes=orbit_periods.get(satellite, default_orbit_period)
+                                if period is None else period)
+        self.gaps = sorted(known_gaps.get(satellite, []) if gaps is None else gaps)
+
+    def gap_at(self, dt):
+        '''
+        Return the known gap containing dt, or None.
+        '''
+        for gap in self.gaps:
+            if gap[0] <= dt <= gap[1]:
+                return gap
+        return None
+
+
+class OrbitalQueryPlanner(object):
+    '''
+    Finds the orbital contexts of a run of days, plus pad boundary orbits either side,
+    with as small a query as it can.
+
+    The query first covers pad nominal periods (plus some slack) beyond the days. Only
+    if fewer than pad orbits were found beyond an edge is that side widened, by one
+    period and then by twice as much each time, or straight past a known gap, up to
+    max_padding, querying just the added slice. Within max_padding the selected
+    orbits are the same as querying with max_padding from the start.
+    '''
+
+    def __init__(self, geometry, pad=0, max_padding=timedelta(hours=6)):
+        self.geometry = geometry
+        self.pad = pad
+        self.max_padding = max_padding
+        self.stats = {'plans': 0, 'widenings': 0}
+
+    def initial_padding(self):
+        if self.pad == 0:
+            return timedelta(0)
+        return min(self.geometry.period * self.pad + timedelta(minutes=period_slack), self.max_padding)
+
+    def _widen(self, padding, edge, direction, periods=1):
+        '''
+        Return padding widened by periods orbital periods, or past the known gap at the
+        edge of the query.
+        '''
+        widened = padding + self.geometry.period * periods
+        gap = self.geometry.gap_at(edge)
+        if gap is not None:
+            beyond = (edge - gap[0]) if direction < 0 else (gap[1] - edge)
+            widened = max(widened, padding + beyond + self.geometry.period)
+        return min(widened, self.max_padding)
+
+    def select(self, days, query):
+        '''
+        Return (all contexts found, list of the selected contexts for each of days), where
+        query(interval) returns the orbital contexts inside a TimeInterval.
+        '''
+        self.stats['plans'] += 1
+        first = days[0]
+        last = days[-1] + timedelta(days=1)
+        before = after = self.initial_padding()
+
+        # Widening only queries the slices added beyond the window already queried
+        found = {}
+        slices = [(first - before, last + after)]
+        steps = [1, 1]
+        while True:
+            for left, right in slices:
+                for context in query(TimeInterval(left, right)):
+                    found[context['granule']] = context
+            timeline = OrbitalTimeline(found.values())
+
+            left = int(timeline.starts.searchsorted(to_datetime64([first])[0], side='left'))
+            right = len(timeline) - int(timeline.starts.searchsorted(to_datetime64([last])[0], side='left'))
+            widen_before = left < self.pad and before < self.max_padding
+            widen_after = right < self.pad and after < self.max_padding
+            if not (widen_before or widen_after):
+                break
+
+            self.stats['widenings'] += 1
+            slices = []
+            if widen_before:
+                widened = self._widen(before, first - before, -1, steps[0])
+                slices.append((first - widened, first - before))
+                before = widened
+                steps[0] *= 2
+            if widen_after:
+                widened = self._widen(after, last + after, 1, steps[1])
+                slices.append((last + after, last + widened))
+                after = widened
+                steps[1] *= 2
+            LOG.debug("Boundary orbit missing, widening the orbital query to -{} +{}".format(before, after))
+
+        return timeline.contexts, timeline.select_many(days, self.pad)
+
+
+def query_padding(satellite, pad, max_padding=timedelta(hours=6)):
+    '''
+    Return the padding the planner first queries beyond the days of satellite.
+    '''
+    return OrbitalQueryPlanner(OrbitGeometry(satellite), pad, max_padding).initial_padding()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Interval-indexed cache of hirs_ctp_orbital contexts, shared across the
+         daily build_task calls of a submission.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+
+from timeutil import TimeInterval
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+# The context keys (after the satellite) which select a set of orbital products
+DELIVERY_KEYS = ['hirs2nc_delivery_id', 'hirs_avhrr_delivery_id',
+                 'hirs_csrb_daily_delivery_id', 'hirs_csrb_monthly_delivery_id',
+                 'hirs_ctp_orbital_delivery_id']
+
+
+def cache_key(context):
+    '''
+    Return the (satellite, delivery ids...) key for a hirs_ctp_daily context.
+    '''
+    return tuple([context['satellite']] + [context[key] for key in DELIVERY_KEYS])
+
+
+class _CacheEntry(object):
+    '''
+    The orbital contexts known for a single cache key, plus the time spans for
+    which the orbital catalog has already been queried.
+    '''
+
+    def __init__(self):
+        self.spans = []         # sorted, merged list of (left, right) queried spans
+        self.contexts = {}      # granule -> orbital context
+        self.granules = []      # sorted granules, for bisection
+
+    def gaps(self, left, right):
+        '''
+        Return the sub-spans of [left, right] that have not yet been queried.
+        '''
+        gaps = []
+        for span_left, span_right in self.spans:
+            if span_right < left:
+                continue
+            if span_left > right:
+                break
+            if span_left > left:
+                gaps.append((left, span_left))
+            left = max(left, span_right)
+        if left < right:
+            gaps.append((left, right))
+        return gaps
+
+    def add(self, left, right, contexts):
+        '''
+        Record that [left, right] has been queried, and that it returned contexts.
+        '''
+        for context in contexts:
+            self.contexts[context['granule']] = context
+        self.granules = sorted(self.contexts.keys())
+
+        spans = sorted(self.spans + [(left, right)])
+        merged = [spans[0]]
+        for span_left, span_right in spans[1:]:
+            if span_left <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], span_right))
+            else:
+                merged.append((span_left, span_right))
+        self.spans = merged
+
+    def forget(self, left, right):
+        '''
+        Drop the contexts with left <= granule <= right, and mark [left, right] as not queried.
+        '''
+        spans = []
+        for span_left, span_right in self.spans:
+            if span_right < left or span_left > right:
+                spans.append((span_left, span_right))
+                continue
+            if span_left < left:
+                spans.append((span_left, left))
+            if span_right > right:
+                spans.append((right, span_right))
+        self.spans = spans
+        for granule in self.granules[bisect_left(self.granules, left):bisect_right(self.granules, right)]:
+            del self.contexts[granule]
+        self.granules = sorted(self.contexts.keys())
+
+    def select(self, left, right):
+        '''
+        Return the cached contexts with left <= granule <= right, sorted by granule.
+        '''
+        start = bisect_left(self.granules, left)
+        end = bisect_right(self.granules, right)
+        return [self.contexts[g] for g in self.granules[start:end]]
+
+
+class OrbitalContextCache(object):
+    '''
+    Memoize hirs_ctp_orbital find_contexts() results by time interval.
+
+    Entries are keyed on (satellite, delivery ids). Querying a window only hits
+    the orbital catalog for the parts of the window that have not been queried
+    before, so prefetching a whole submission range once lets every daily
+    build_task answer its padded window from memory.
+
+    If given, bind(satellite) is called before each catalog query, e.g. to point
+    hirs_ctp_orbital at that satellite's data lists.
+    '''
+
+    def __init__(self, computation=None, bind=None):
+        self._computation = computation
+        self._bind = bind
+        self._entries = {}
+        self._lock = threading.RLock()
+        self.stats = {'queries': 0, 'hits': 0, 'invalidations': 0}
+
+    @property
+    def computation(self):
+        if self._computation is None:
+            import flo.sw.hirs_ctp_orbital as hirs_ctp_orbital
+            self._computation = hirs_ctp_orbital.HIRS_CTP_ORBITAL()
+        return self._computation
+
+    def invalidate(self, key=None):
+        '''
+        Drop the cached contexts for key, or for every key if key is None.
+        '''
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self.stats['invalidations'] += 1
+
+    def invalidate_satellite(self, satellite):
+        '''
+        Drop the cached contexts for every key of satellite.
+        '''
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == satellite]:
+                self.invalidate(key)
+
+    def invalidate_interval(self, interval, context):
+        '''
+        Drop the cached contexts inside interval for the satellite and delivery ids of
+        context, so the next query of it asks the orbital catalog again, e.g. for orbits
+        which have landed since.
+        '''
+        with self._lock:
+            entry = self._entries.get(cache_key(context))
+            if entry is not None:
+                entry.forget(interval.left, interval.right)
+                self.stats['invalidations'] += 1
+
+    def _entry(self, key):
+        '''
+        Return the entry for key, dropping stale entries for the same satellite
+        which were made with different delivery ids.
+        '''
+        if key not in self._entries:
+            for stale_key in [k for k in self._entries if k[0] == key[0]]:
+                LOG.info("Delivery ids changed for {}, invalidating {}".format(key[0], stale_key))
+                self.invalidate(stale_key)
+            self._entries[key] = _CacheEntry()
+        return self._entries[key]
+
+    def prefetch(self, interval, context):
+        '''
+        Query the orbital catalog for any part of interval not already cached.
+        '''
+        with self._lock:
+            entry = self._entry(cache_key(context))
+            gaps = entry.gaps(interval.left, interval.right)
+            if not gaps:
+                self.stats['hits'] += 1
+            if gaps and self._bind is not None:
+                self._bind(context['satellite'])
+            for left, right in gaps:
+                LOG.debug("Querying hirs_ctp_orbital contexts for {} -> {}".format(left, right))
+                contexts = self.computation.find_contexts(TimeInterval(left, right),
+                                                          *cache_key(context))
+                self.stats['queries'] += 1
+                entry.add(left, right, contexts)
+            return entry
+
+    def find_contexts(self, interval, context):
+        '''
+        Return the orbital contexts with granules inside interval, for the satellite
+        and delivery ids of the hirs_ctp_daily context.
+        '''
+        with self._lock:
+            entry = self.prefetch(interval, context)
+            return entry.select(interval.left, interval.right)
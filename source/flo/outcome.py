@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Classify hirs_ctp_daily task failures as transient or permanent, retry the
+         transient ones, and keep a shared ledger of task outcomes from which failure
+         rates per satellite and delivery are worked out.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import re
+import json
+import time
+import fcntl
+import socket
+import logging
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+SUCCESS = 'success'
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+# Ledger records which aren't task outcomes: a task not run because its delivery was
+# suspect, and a reset of the failure history of a satellite and delivery
+SKIPPED = 'skipped'
+CLEARED = 'cleared'
+
+# stderr messages of failures which may well not happen again on another try
+transient_patterns = [r'No space left on device', r'Resource temporarily unavailable',
+                      r'Stale (NFS )?file handle', r'Connection (timed out|refused|reset)',
+                      r'Input/output error', r'Cannot allocate memory', r'Too many open files',
+                      r'Disk quota exceeded', r'unable to lock file']
+
+# stderr messages of failures which will happen every time
+permanent_patterns = [r'Segmentation fault', r'No such file or directory', r'cannot execute',
+                      r'Permission denied', r'command not found', r'Illegal instruction',
+                      r'NetCDF: (Unknown file format|HDF error|Variable not found)',
+                      r'error while loading shared libraries']
+
+# Return codes of processes killed from outside, e.g. preempted or out of memory, as
+# signals and as the shell reports them; and of crashes, and commands that can't run
+transient_returncodes = [-9, -15, 137, 143]
+permanent_returncodes = [-4, -6, -7, -8, -11, 126, 127, 132, 134, 135, 136, 139]
+
+# Exceptions, by class name, which mean the task may well work on another try
+transient_exceptions = ['FileNotFound', 'WorkflowNotReady']
+
+# What failures matching none of the above are taken to be
+default_failure = PERMANENT
+
+
+class TaskFailure(Exception):
+    '''
+    A task which failed, with outcome TRANSIENT or PERMANENT.
+    '''
+
+    def __init__(self, outcome, message, returncode=None):
+        Exception.__init__(self, message)
+        self.outcome = outcome
+        self.returncode = returncode
+
+
+def classify(returncode, stderr=''):
+    '''
+    Return SUCCESS, TRANSIENT or PERMANENT for a process's return code and stderr.
+    '''
+    if returncode == 0:
+        return SUCCESS
+    for pattern in transient_patterns:
+        if re.search(pattern, stderr or ''):
+            return TRANSIENT
+    for pattern in permanent_patterns:
+        if re.search(pattern, stderr or ''):
+            return PERMANENT
+    if returncode in transient_returncodes:
+        return TRANSIENT
+    if returncode in permanent_returncodes:
+        return PERMANENT
+    return default_failure
+
+
+def exception_outcome(err):
+    '''
+    Return TRANSIENT or PERMANENT for an exception raised by a task.
+    '''
+    if isinstance(err, TaskFailure):
+        return err.outcome
+    if type(err).__name__ in transient_exceptions:
+        return TRANSIENT
+    return classify(None, '{}: {}'.format(type(err).__name__, err))
+
+
+def run_with_retries(function, attempts=3, backoff=30., max_backoff=300., sleep=time.sleep):
+    '''
+    Return function(), calling it again after a doubling delay, capped at max_backoff
+    seconds, each time it raises a transient TaskFailure, for up to attempts calls.
+    Permanent failures are raised at once.
+    '''
+    for attempt in range(1, attempts + 1):
+        try:
+            return function()
+        except TaskFailure as failure:
+            if failure.outcome != TRANSIENT or attempt == attempts:
+                raise
+            delay = min(backoff * 2 ** (attempt - 1), max_backoff)
+            LOG.warning("Transient failure ({}), retrying in {:.0f}s ({} of {} attempts)".format(
+                failure, delay, attempt, attempts))
+            sleep(delay)
+
+
+class OutcomeLedger(object):
+    '''
+    Task outcomes appended as JSON lines to filename, which many tasks can share.
+    The outcomes of each satellite and delivery are kept in memory, reading only
+    the records appended since the last look.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._offset = 0
+        self._outcomes = {}
+
+    def record(self, context, outcome, reason=None, returncode=None):
+        record = {'satellite': context['satellite'],
+                  'granule': context['granule'],
+                  'delivery_id': context['hirs_ctp_daily_delivery_id'],
+                  'outcome': outcome,
+                  'reason': reason,
+                  'returncode': returncode,
+                  'host': socket.gethostname(),
+                  'time': time.time()}
+        line = json.dumps(record, default=str, sort_keys=True)
+        try:
+            with open(self.filename, 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.write(line + '\n')
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        except IOError as err:
+            LOG.warning("Could not record the task outcome in {}: {}".format(self.filename, err))
+
+    def clear(self, satellite, delivery_id):
+        '''
+        Forget the failures of satellite with delivery_id so far, so its tasks are run again.
+        '''
+        self.record({'satellite': satellite, 'granule': None, 'hirs_ctp_daily_delivery_id': delivery_id},
+                    CLEARED, 'failure history cleared')
+
+    def records(self):
+        if not os.path.exists(self.filename):
+            return []
+        records = []
+        with open(self.filename) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records
+
+    def _update(self):
+        '''
+        Add the outcomes recorded since the last update to those of each satellite and
+        delivery, starting again if the ledger has been replaced by a shorter one.
+        '''
+        if not os.path.exists(self.filename):
+            self._offset = 0
+            self._outcomes = {}
+            return
+        if os.path.getsize(self.filename) < self._offset:
+            self._offset = 0
+            self._outcomes = {}
+        with open(self.filename, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                # Leave a record still being written for the next update
+                if not line.endswith(b'\n'):
+                    break
+                self._offset += len(line)
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    continue
+                outcomes = self._outcomes.setdefault((record['satellite'], record['delivery_id']), [])
+                if record['outcome'] == CLEARED:
+                    del outcomes[:]
+                elif record['outcome'] != SKIPPED:
+                    outcomes.append(record['outcome'])
+
+    def is_suspect(self, satellite, delivery_id, window=20, min_failures=5, max_rate=0.5):
+        '''
+        Return whether at least min_failures, and more than max_rate, of the last window
+        tasks of satellite with delivery_id failed permanently. Skipped tasks don't count,
+        and neither do tasks before the history was last cleared.
+        '''
+        self._update()
+        recent = self._outcomes.get((satellite, delivery_id), [])[-window:]
+        failures = recent.count(PERMANENT)
+        return failures >= min_failures and failures > max_rate * len(recent)
+
+
+def failure_rates(records):
+    '''
+    Return a dict of (satellite, delivery id) -> counts of each outcome, plus the
+    'tasks' and 'failure_rate' over all of them. Skipped tasks and clearings are left out.
+    '''
+    rates = {}
+    for record in records:
+        if record['outcome'] in (SKIPPED, CLEARED):
+            continue
+        stats = rates.setdefault((record['satellite'], record['delivery_id']),
+                                 {SUCCESS: 0, TRANSIENT: 0, PERMANENT: 0, 'tasks': 0})
+        stats[record['outcome']] += 1
+        stats['tasks'] += 1
+    for stats in rates.values():
+        stats['failure_rate'] = float(stats[TRANSIENT] + stats[PERMANENT]) / stats['tasks']
+    return rates
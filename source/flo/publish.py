@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Publish hirs_ctp_daily products into the results tree as symlinks to the
+         product store.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import logging
+from multiprocessing.pool import ThreadPool
+from os.path import basename, isdir, islink, lexists, join as pjoin
+
+from flo.sw.hirs_ctp_daily import daily_products
+from flo.sw.hirs_ctp_daily.catalog import CachedProductCatalog, product_key
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+CREATED = 'created'
+UPDATED = 'updated'
+SKIPPED = 'skipped'
+MISSING = 'missing'
+
+
+def _link(args):
+    '''
+    Make link point at target, returning what was done.
+    '''
+    target, link = args
+    if islink(link):
+        if os.readlink(link) == target:
+            return SKIPPED
+        os.remove(link)
+        os.symlink(target, link)
+        return UPDATED
+    if lexists(link):
+        return SKIPPED
+    os.symlink(target, link)
+    return CREATED
+
+
+def publish(comp, contexts, product_dir, results_dir, output='out', workers=8, catalog=None,
+            granularity=1):
+    '''
+    Symlink the output products of contexts from product_dir into results_dir,
+    returning a dict counting the links created, updated (pointing at an older
+    product), skipped (already correct) and missing (no product yet). Products
+    are looked up once each through a CachedProductCatalog; links are made from a
+    pool of threads. Running it again only touches links which have changed.
+
+    If granularity is more than a day, contexts are HIRS_CTP_DAILY days, and a day
+    without its own product is published from the HIRS_CTP_DAILY_BLOCK of that
+    granularity which made it, at the same place in results_dir.
+    '''
+    catalog = CachedProductCatalog() if catalog is None else catalog
+
+    if granularity > 1:
+        candidates = daily_products(contexts, granularity)
+    else:
+        candidates = [[comp.dataset(output).product(context)] for context in contexts]
+    presence, files = catalog.lookup([product for products in candidates for product in products],
+                                     resolve=True)
+
+    links = []
+    for context, products in zip(contexts, candidates):
+        found = [product for product in products if presence[product_key(product)]]
+        if len(found) == 0:
+            continue
+        target = pjoin(product_dir, files[product_key(found[0])].path)
+        link_dir = pjoin(results_dir, comp.context_path(context, output))
+        links.append((target, pjoin(link_dir, basename(target))))
+
+    for link_dir in sorted(set([os.path.dirname(link) for _, link in links])):
+        if not isdir(link_dir):
+            os.makedirs(link_dir)
+
+    summary = {CREATED: 0, UPDATED: 0, SKIPPED: 0, MISSING: len(contexts) - len(links)}
+    pool = ThreadPool(workers)
+    try:
+        for result in pool.imap_unordered(_link, links, chunksize=64):
+            summary[result] += 1
+    finally:
+        pool.close()
+        pool.join()
+
+    LOG.info("Published {} contexts: {created} created, {updated} updated, {skipped} skipped, "
+             "{missing} missing".format(len(contexts), **summary))
+    LOG.debug("Catalog lookups: {}".format(catalog.stats))
+    return summary
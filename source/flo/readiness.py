@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Per-day CTP Orbital coverage, and a scheduler which only submits the days
+         that are ready, rechecking the others with backoff across runs.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import json
+import time
+import logging
+from datetime import timedelta
+
+import numpy as np
+
+from flo.sw.hirs_ctp_daily.timeline import OrbitalTimeline, day_start, to_datetime64
+from flo.sw.hirs_ctp_daily.orbit_geometry import OrbitGeometry, period_slack
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+READY = 'ready'
+WAITING = 'waiting'
+SUBMITTED = 'submitted'
+GAVE_UP = 'gave up'
+
+
+def day_coverage(orbital_contexts, days, period):
+    '''
+    Return (coverage, before, after) arrays for days: the fraction of each day covered
+    by orbits, taking each orbit to last period or until the next one starts, and
+    whether an orbit starts within a period (plus slack) before the day, and after it.
+    '''
+    timeline = OrbitalTimeline(orbital_contexts)
+    period = np.timedelta64(int(period.total_seconds()), 's')
+    slack = np.timedelta64(int(period_slack * 60), 's')
+    day_starts = to_datetime64([day_start(day) for day in days])
+    day_ends = day_starts + np.timedelta64(1, 'D')
+
+    if len(timeline) == 0:
+        zeros = np.zeros(len(days))
+        return zeros, zeros.astype(bool), zeros.astype(bool)
+
+    # Non-overlapping covered segments, and the seconds covered before each one starts
+    starts = timeline.starts
+    ends = np.minimum(starts + period, np.append(starts[1:], starts[-1] + period))
+    lengths = (ends - starts).astype('timedelta64[s]').astype(np.int64)
+    covered_before = np.concatenate([[0], np.cumsum(lengths)])
+
+    def covered(times):
+        idx = starts.searchsorted(times, side='right') - 1
+        inside = np.clip((times - starts[np.maximum(idx, 0)]).astype('timedelta64[s]').astype(np.int64),
+                         0, lengths[np.maximum(idx, 0)])
+        return np.where(idx >= 0, covered_before[np.maximum(idx, 0)] + inside, 0)
+
+    coverage = (covered(day_ends) - covered(day_starts)) / 86400.
+    before = (starts.searchsorted(day_starts, side='left') -
+              starts.searchsorted(day_starts - period - slack, side='left')) > 0
+    after = (starts.searchsorted(day_ends + period + slack, side='left') -
+             starts.searchsorted(day_ends, side='left')) > 0
+    return coverage, before, after
+
+
+class ReadinessScheduler(object):
+    '''
+    Decides which contexts to submit from the CTP Orbital coverage of their days.
+
+    A day is ready once min_coverage of it is covered (by default, all but about one
+    orbit's worth) and, if require_boundary, there are orbits either side of it.
+    Days which aren't are rechecked after a backoff which doubles each time, from
+    backoff up to max_backoff, until max_attempts.
+    The state of every day is kept in state_file, so a restarted run only rechecks
+    the days which are due. Days given up on, or already submitted, are only checked
+    again once reset().
+    '''
+
+    def __init__(self, state_file, min_coverage=0.9, require_boundary=False,
+                 backoff=timedelta(hours=6), max_backoff=timedelta(days=7), max_attempts=10):
+        self.state_file = state_file
+        self.min_coverage = min_coverage
+        self.require_boundary = require_boundary
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.state = {}
+        if os.path.exists(state_file):
+            with open(state_file) as f:
+                self.state = json.load(f)
+
+    def save(self):
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.state, f, indent=1, sort_keys=True)
+        os.rename(tmp_file, self.state_file)
+
+    @staticmethod
+    def key(context, day):
+        return '{} {}'.format(context['satellite'], day.strftime('%Y-%m-%d'))
+
+    @staticmethod
+    def days(context):
+        return [context['granule'] + timedelta(days=idx) for idx in range(context.get('days', 1))]
+
+    def due(self, contexts, now=None):
+        '''
+        Return the contexts with a day which is neither submitted nor backing off.
+        '''
+        now = time.time() if now is None else now
+        due = []
+        for context in contexts:
+            for day in self.days(context):
+                entry = self.state.get(self.key(context, day), {})
+                if entry.get('status') in (SUBMITTED, GAVE_UP):
+                    continue
+                if entry.get('next_check', 0) <= now:
+                    due.append(context)
+                    break
+        return due
+
+    def schedule(self, contexts, orbital_contexts, now=None):
+        '''
+        Return the due contexts whose days are all ready, given the orbital contexts
+        covering them, and requeue the rest.
+        '''
+        now = time.time() if now is None else now
+        contexts = self.due(contexts, now)
+        if not contexts:
+            return []
+
+        days = [day for context in contexts for day in self.days(context)]
+        period = OrbitGeometry(contexts[0]['satellite']).period
+        coverage, before, after = day_coverage(orbital_contexts, days, period)
+        ready_days = coverage >= self.min_coverage
+        if self.require_boundary:
+            ready_days &= before & after
+
+        ready = []
+        idx = 0
+        for context in contexts:
+            num_days = len(self.days(context))
+            context_ready = bool(ready_days[idx:idx + num_days].all())
+            for offset, day in enumerate(self.days(context)):
+                entry = self.state.setdefault(self.key(context, day), {'attempts': 0})
+                entry.update({'coverage': round(float(coverage[idx + offset]), 4),
+                              'boundary': bool(before[idx + offset] and after[idx + offset]),
+                              'checked': now})
+                if context_ready:
+                    entry['status'] = READY
+                    continue
+                entry['attempts'] += 1
+                if entry['attempts'] >= self.max_attempts:
+                    entry['status'] = GAVE_UP
+                    LOG.warning("Giving up on {} after {} checks, coverage {:.0%}".format(
+                        day.date(), entry['attempts'], entry['coverage']))
+                    continue
+                delay = min(self.backoff.total_seconds() * 2 ** (entry['attempts'] - 1),
+                            self.max_backoff.total_seconds())
+                entry.update({'status': WAITING, 'next_check': now + delay})
+            if context_ready:
+                ready.append(context)
+            idx += num_days
+
+        LOG.info("{} of {} due contexts are ready, {} requeued".format(
+            len(ready), len(contexts), len(contexts) - len(ready)))
+        self.save()
+        return ready
+
+    def reset(self, contexts):
+        '''
+        Forget the state of the days of contexts, so they are checked again at once,
+        even those given up on or already submitted.
+        '''
+        keys = [self.key(context, day) for context in contexts for day in self.days(context)]
+        reset = [key for key in keys if self.state.pop(key, None) is not None]
+        if reset:
+            LOG.info("Reset the readiness of {} days".format(len(reset)))
+            self.save()
+
+    def mark_submitted(self, contexts):
+        for context in contexts:
+            for day in self.days(context):
+                self.state.setdefault(self.key(context, day), {'attempts': 0})['status'] = SUBMITTED
+        self.save()
+
+    def next_check(self):
+        '''
+        Return the time of the next due recheck, or None if nothing is waiting.
+        '''
+        waiting = [entry['next_check'] for entry in self.state.values() if entry.get('status') == WAITING]
+        return min(waiting) if waiting else None
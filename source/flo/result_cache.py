@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Content-addressed cache of compressed hirs_ctp_daily outputs, keyed by a
+         fingerprint of the task's inputs and software version.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import fcntl
+import hashlib
+import logging
+import shutil
+import tempfile
+from os.path import basename, dirname, exists, getsize, isdir, join as pjoin
+
+USAGE_FILE = '.usage'
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+
+def fingerprint(input_files, delivery_id, version, output_name, compression=''):
+    '''
+    Return a key identifying the result of making output_name from input_files with
+    the CTP daily binary, version, of delivery delivery_id, and compressing it as
+    described by compression.
+    The inputs are identified by name, size and modification time, in sorted order,
+    without reading them, so a reprocessed orbital file gives a new key. Staged
+    copies keep the modification time of their source, so give the same key.
+    '''
+    digest = hashlib.sha1()
+    for item in [delivery_id, version, output_name, compression]:
+        digest.update('{}\n'.format(item).encode('utf-8'))
+    for path in sorted(input_files, key=basename):
+        st = os.stat(path)
+        digest.update('{} {} {}\n'.format(basename(path), st.st_size, int(st.st_mtime)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    '''
+    Directory of previously made outputs, with one subdirectory per fingerprint.
+
+    Entries are evicted least recently used first once the cache holds more than
+    max_bytes. The modification time of an entry's directory records its last use.
+    The bytes stored are tallied in root/.usage, shared by every process using the
+    cache, so the tree is only walked to evict once the tally passes max_bytes; it
+    is then brought down to evict_to of max_bytes, so the next walk is a while off.
+    '''
+
+    evict_to = 0.9
+
+    def __init__(self, root, max_bytes=10 * 1024**3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        if not isdir(root):
+            os.makedirs(root)
+
+    def _entry_dir(self, key):
+        return pjoin(self.root, key[:2], key)
+
+    def fetch(self, key, dest_dir='.'):
+        '''
+        Copy the cached output for key into dest_dir, returning its path, or None
+        if the cache has no entry for key.
+        '''
+        entry_dir = self._entry_dir(key)
+        files = os.listdir(entry_dir) if isdir(entry_dir) else []
+        if len(files) != 1:
+            self.stats['misses'] += 1
+            LOG.info("Result cache miss for {} ({})".format(key, self.stats))
+            return None
+
+        dest = pjoin(dest_dir, files[0])
+        shutil.copy2(pjoin(entry_dir, files[0]), dest)
+        os.utime(entry_dir, None)
+        self.stats['hits'] += 1
+        LOG.info("Result cache hit for {}: {} ({})".format(key, files[0], self.stats))
+        return dest
+
+    def store(self, key, path):
+        '''
+        Add a copy of the output file path to the cache as the result for key.
+        '''
+        entry_dir = self._entry_dir(key)
+        if exists(entry_dir):
+            return
+
+        parent = dirname(entry_dir)
+        if not isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                if not isdir(parent):
+                    raise
+
+        # Copy into a temporary directory first, so other tasks never see a partial entry
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp_', dir=parent)
+        try:
+            shutil.copy2(path, pjoin(tmp_dir, basename(path)))
+            os.rename(tmp_dir, entry_dir)
+            self.stats['stores'] += 1
+        except OSError:
+            LOG.debug("Result cache entry {} was stored by another task".format(key))
+            return
+        finally:
+            if exists(tmp_dir):
+                shutil.rmtree(tmp_dir)
+
+        if self.add_usage(getsize(path)) > self.max_bytes:
+            self.evict()
+
+    def _update_usage(self, update):
+        '''
+        Replace the tally of bytes in the cache with update(tally), holding a lock on
+        the tally file, and return the new tally. A missing tally is counted afresh.
+        '''
+        with open(pjoin(self.root, USAGE_FILE), 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                text = f.read().strip()
+                usage = update(int(text) if text else None)
+                f.seek(0)
+                f.truncate()
+                f.write('{}\n'.format(usage))
+                return usage
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def add_usage(self, size):
+        '''
+        Add size bytes to the tally of bytes in the cache, returning the new tally.
+        '''
+        def add(usage):
+            if usage is None:
+                return sum([entry_size for _, entry_size, _ in self._entries()])
+            return usage + size
+        return self._update_usage(add)
+
+    def _entries(self):
+        '''
+        Return a list of (last use, size, directory) for every entry in the cache.
+        '''
+        entries = []
+        for prefix in os.listdir(self.root):
+            prefix_dir = pjoin(self.root, prefix)
+            if not isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = pjoin(prefix_dir, key)
+                if key.startswith('.tmp_') or not isdir(entry_dir):
+                    continue
+                size = sum([getsize(pjoin(entry_dir, name)) for name in os.listdir(entry_dir)])
+                entries.append((os.stat(entry_dir).st_mtime, size, entry_dir))
+        return entries
+
+    def _remove(self, entry_dir):
+        '''
+        Remove entry_dir from the cache, returning whether it was removed.
+        '''
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        return True
+
+    def evict(self):
+        '''
+        Remove the least recently used entries until the cache fits in evict_to of
+        max_bytes.
+        '''
+        entries = self._entries()
+        total = sum([size for _, size, _ in entries])
+        entries.sort()
+        while entries and total > self.max_bytes * self.evict_to:
+            _, size, entry_dir = entries.pop(0)
+            if not self._remove(entry_dir):
+                continue
+            total -= size
+            self.stats['evictions'] += 1
+            LOG.debug("Evicted {} ({} bytes) from the result cache".format(entry_dir, size))
+        self._update_usage(lambda usage: total)
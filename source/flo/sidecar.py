@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Uncompressed, memory-mappable sidecars of the daily CTP statistics, and a
+         per-satellite index of them, so that monthly and climatology summaries
+         can be read without opening the compressed daily files.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import fcntl
+import logging
+from os.path import basename, exists, getsize, splitext, join as pjoin
+
+import numpy as np
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+SIDECAR_SUFFIX = '.stats.npy'
+DTYPE = np.dtype('<f4')
+
+
+class SidecarError(Exception):
+    '''
+    A daily file whose statistics can't be read into a sidecar.
+    '''
+
+
+def sidecar_filename(daily_file, directory='.'):
+    return pjoin(directory, splitext(basename(daily_file))[0] + SIDECAR_SUFFIX)
+
+
+def grid_variables(ds):
+    '''
+    Return the names of the gridded statistics of the netCDF Dataset ds: the numeric
+    variables of two or more dimensions which share the most common such dimensions,
+    in the order the file has them.
+    '''
+    groups = {}
+    for name, var in ds.variables.items():
+        if len(var.dimensions) >= 2 and var.dtype.kind in 'iuf':
+            groups.setdefault(var.dimensions, []).append(name)
+    if not groups:
+        return []
+    return max(groups.values(), key=len)
+
+
+def read_daily_statistics(filename):
+    '''
+    Return (names, stats) for a daily file, where names are its gridded variables, as
+    written by create_daily_daynight_ctps.exe, and stats is a (len(names), ...) array of
+    them, with masked cells set to NaN.
+
+    Raises SidecarError if the file has no gridded variables.
+    '''
+    from netCDF4 import Dataset
+
+    with Dataset(filename) as ds:
+        names = grid_variables(ds)
+        if not names:
+            raise SidecarError('{} has no gridded variables (it has {})'.format(
+                basename(filename), ', '.join(ds.variables)))
+        planes = [np.ma.filled(np.ma.asarray(ds.variables[name][:], dtype=DTYPE), np.nan)
+                  for name in names]
+    return names, np.array(planes, dtype=DTYPE)
+
+
+def write_sidecar(filename, stats):
+    '''
+    Write stats as a .npy file, which np.load(filename, mmap_mode='r') maps without copying.
+    '''
+    tmp_file = filename + '.tmp.npy'
+    array = np.lib.format.open_memmap(tmp_file, mode='w+', dtype=DTYPE, shape=stats.shape)
+    array[:] = stats
+    array.flush()
+    del array
+    os.rename(tmp_file, filename)
+    return filename
+
+
+def load_sidecar(filename):
+    return np.load(filename, mmap_mode='r')
+
+
+def day_summary(names, stats):
+    '''
+    Return a dict of the mean of the filled cells of each of the variables names in stats,
+    NaN if there are none.
+    '''
+    summary = {}
+    for name, plane in zip(names, stats):
+        filled = plane[np.isfinite(plane)].astype(np.float64)
+        summary[name] = float(filled.mean()) if filled.size else float('nan')
+    return summary
+
+
+class SidecarIndex(object):
+    '''
+    The sidecars of one satellite, consolidated into a single flat file of float32
+    records, with a tab-separated index of each record's day and the mean of each
+    variable. The variables and grid shape are set by the first day appended.
+
+    Days are appended under a file lock, so concurrent tasks can share the index;
+    a reprocessed day is appended again and its latest record wins. grids() maps
+    the records with np.memmap, without copying.
+    '''
+
+    def __init__(self, root, satellite):
+        self.root = root
+        self.satellite = satellite
+        self.data_file = pjoin(root, '{}_stats.dat'.format(satellite))
+        self.index_file = pjoin(root, '{}_index.tsv'.format(satellite))
+
+    def append(self, day, names, stats):
+        '''
+        Add the sidecar stats of the variables names for day, a datetime, returning its
+        record number.
+        '''
+        stats = np.ascontiguousarray(stats, dtype=DTYPE)
+        if not os.path.isdir(self.root):
+            try:
+                os.makedirs(self.root)
+            except OSError:
+                if not os.path.isdir(self.root):
+                    raise
+
+        with open(self.index_file, 'a') as index:
+            fcntl.flock(index, fcntl.LOCK_EX)
+            try:
+                if index.tell() == 0:
+                    index.write('# shape={}\n'.format(','.join([str(n) for n in stats.shape])))
+                    index.write('\t'.join(['day', 'record'] + list(names)) + '\n')
+                elif stats.shape != self.shape() or list(names) != self.variables():
+                    raise ValueError('Sidecar variables {} {} do not match the index {} {}'.format(
+                        list(names), stats.shape, self.variables(), self.shape()))
+                record = getsize(self.data_file) // stats.nbytes if exists(self.data_file) else 0
+                with open(self.data_file, 'r+b' if exists(self.data_file) else 'wb') as data:
+                    data.seek(record * stats.nbytes)
+                    data.write(stats.tobytes())
+                summary = day_summary(names, stats)
+                index.write('\t'.join([day.strftime('%Y-%m-%d'), str(record)] +
+                                      [str(summary[name]) for name in names]) + '\n')
+                index.flush()
+            finally:
+                fcntl.flock(index, fcntl.LOCK_UN)
+        return record
+
+    def shape(self):
+        with open(self.index_file) as index:
+            header = index.readline()
+        return tuple([int(n) for n in header.split('=', 1)[1].split(',')])
+
+    def variables(self):
+        with open(self.index_file) as index:
+            index.readline()
+            return index.readline().rstrip('\n').split('\t')[2:]
+
+    def days(self):
+        '''
+        Return a dict of day ('YYYY-MM-DD') -> (record, summary dict), using the latest
+        record of each day.
+        '''
+        days = {}
+        if not exists(self.index_file):
+            return days
+        names = self.variables()
+        with open(self.index_file) as index:
+            for line in index:
+                fields = line.rstrip('\n').split('\t')
+                if line.startswith('#') or fields[0] == 'day':
+                    continue
+                summary = dict(zip(names, [float(value) for value in fields[2:]]))
+                days[fields[0]] = (int(fields[1]), summary)
+        return days
+
+    def grids(self):
+        '''
+        Return a read-only (records, variables, ...) memmap of every record, or None if
+        there are none yet.
+        '''
+        if not exists(self.data_file):
+            return None
+        shape = self.shape()
+        record_bytes = DTYPE.itemsize * int(np.prod(shape))
+        return np.memmap(self.data_file, dtype=DTYPE, mode='r',
+                         shape=(getsize(self.data_file) // record_bytes,) + shape)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Node-local staging cache of CTP Orbital inputs, so that files read by
+         several consecutive days are only fetched from network storage once.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import os
+import fcntl
+import hashlib
+import logging
+import shutil
+import tempfile
+from os.path import basename, dirname, exists, getsize, isdir, realpath, join as pjoin
+
+from flo.sw.hirs_ctp_daily.result_cache import ResultCache
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+LOCK_FILE = '.lock'
+
+
+class StagingCache(ResultCache):
+    '''
+    Local copies of input files, kept below root with least recently used eviction
+    once they take up more than max_bytes.
+
+    Entries are keyed on the source's real path, size and modification time, so a
+    reprocessed input is staged afresh. Inputs are always copied, keeping their
+    modification time; a staged copy is reused while its size and modification time
+    still match the source's.
+
+    A task holds a shared lock on the entries it staged until release() is called,
+    and entries are only evicted if no task holds them, so a file is never removed
+    from under another task on the node which still reaches it through a symlink.
+    '''
+
+    def __init__(self, root, max_bytes=50 * 1024**3):
+        ResultCache.__init__(self, root, max_bytes)
+        self.stats = {'hits': 0, 'misses': 0, 'bytes_saved': 0, 'bytes_copied': 0,
+                      'evictions': 0, 'stale': 0}
+        self._held = []
+
+    def key(self, path):
+        source = realpath(path)
+        st = os.stat(source)
+        return hashlib.sha1('{} {} {}'.format(source, st.st_size, st.st_mtime).encode('utf-8')).hexdigest()
+
+    def _hold(self, entry_dir):
+        '''
+        Take a shared lock on entry_dir, returning False if it was evicted meanwhile.
+        '''
+        try:
+            lock = open(pjoin(entry_dir, LOCK_FILE), 'r')
+        except IOError:
+            return False
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        if os.fstat(lock.fileno()).st_nlink == 0:
+            lock.close()
+            return False
+        self._held.append(lock)
+        return True
+
+    def release(self):
+        '''
+        Release the entries staged since the last release(), so they may be evicted.
+        '''
+        for lock in self._held:
+            lock.close()
+        self._held = []
+
+    def _remove(self, entry_dir):
+        try:
+            lock = open(pjoin(entry_dir, LOCK_FILE), 'r')
+        except IOError:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return True
+        try:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                LOG.debug("Not evicting {}, a task is using it".format(entry_dir))
+                return False
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return True
+        finally:
+            lock.close()
+
+    def _lookup(self, key, name, source):
+        '''
+        Return the staged file for key, holding it, if it is present and matches source;
+        source itself if a copy which no longer matches is still used by another task;
+        else None.
+        '''
+        entry_dir = self._entry_dir(key)
+        staged = pjoin(entry_dir, name)
+        if not exists(staged) or not self._hold(entry_dir):
+            return None
+        st, source_st = os.stat(staged), os.stat(source)
+        if st.st_size != source_st.st_size or int(st.st_mtime) != int(source_st.st_mtime):
+            LOG.warning("Staged file {} no longer matches {}, restaging".format(staged, source))
+            self.stats['stale'] += 1
+            self._held.pop().close()
+            return None if self._remove(entry_dir) else source
+        os.utime(entry_dir, None)
+        return staged
+
+    def stage(self, path):
+        '''
+        Return the path of a local copy of path, staging it first if need be, and hold
+        it until release() is called.
+        '''
+        key = self.key(path)
+        name = basename(path)
+        source = realpath(path)
+
+        staged = self._lookup(key, name, source)
+        if staged == source:
+            self.stats['misses'] += 1
+            return source
+        if staged is not None:
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += getsize(staged)
+            return staged
+
+        self.stats['misses'] += 1
+        entry_dir = self._entry_dir(key)
+        parent = dirname(entry_dir)
+        if not isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                if not isdir(parent):
+                    raise
+
+        # Stage into a temporary directory first, so other tasks never see a partial entry
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp_', dir=parent)
+        try:
+            tmp_file = pjoin(tmp_dir, name)
+            shutil.copy2(source, tmp_file)
+            if getsize(tmp_file) != getsize(source):
+                raise IOError('Size mismatch staging {}'.format(path))
+            open(pjoin(tmp_dir, LOCK_FILE), 'w').close()
+            try:
+                os.rename(tmp_dir, entry_dir)
+                self.stats['bytes_copied'] += getsize(pjoin(entry_dir, name))
+                self.add_usage(getsize(pjoin(entry_dir, name)))
+            except OSError:
+                LOG.debug("{} was staged by another task".format(path))
+        finally:
+            if exists(tmp_dir):
+                shutil.rmtree(tmp_dir)
+
+        if not self._hold(entry_dir):
+            raise IOError('{} was evicted as soon as it was staged'.format(path))
+        return pjoin(entry_dir, name)
+
+    def stage_inputs(self, inputs):
+        '''
+        Stage every file of the flo inputs dict, returning a dict of the local paths,
+        and log the hit rate and bytes saved for these inputs. The inputs are held
+        until release() is called.
+        '''
+        before = dict(self.stats)
+        staged = dict((name, self.stage(path)) for name, path in inputs.items())
+        # This task's own inputs are held, so are never evicted
+        if self.add_usage(0) > self.max_bytes:
+            self.evict()
+        task = dict((key, self.stats[key] - before[key]) for key in self.stats)
+
+        total = task['hits'] + task['misses']
+        LOG.info("Staging cache: {} of {} inputs reused ({:.0f}%), {} bytes saved, {} bytes copied".format(
+            task['hits'], total, 100. * task['hits'] / max(total, 1),
+            task['bytes_saved'], task['bytes_copied']))
+        return staged
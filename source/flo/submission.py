@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Plan, batch and concurrently submit hirs_ctp_daily contexts, recording
+         the outcome of every batch in a single job ledger.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import json
+import logging
+import threading
+import time
+import traceback
+from calendar import monthrange
+from datetime import datetime, timedelta
+from itertools import count
+from multiprocessing.pool import ThreadPool
+
+from timeutil import TimeInterval
+
+from flo.sw.hirs_ctp_daily.catalog import CachedProductCatalog, product_key
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+
+def setup_computation(satellite, granularity=1):
+    '''
+    Point hirs_ctp_daily at the data lists of satellite, returning the computation to
+    submit: HIRS_CTP_DAILY, or HIRS_CTP_DAILY_BLOCK if granularity is more than a day.
+    '''
+    import flo.sw.hirs_ctp_daily as hirs_ctp_daily
+
+    input_data = {'HIR1B': '/mnt/software/flo/hirs_l1b_datalists/{0:}/HIR1B_{0:}_latest'.format(satellite),
+                  'CFSR':  '/mnt/cephfs_data/geoffc/hirs_data_lists/CFSR.out',
+                  'PTMSX': '/mnt/software/flo/hirs_l1b_datalists/{0:}/PTMSX_{0:}_latest'.format(satellite)}
+
+    # Data locations
+    collection = {'HIR1B': 'ILIAD',
+                  'CFSR': 'DELTA',
+                  'PTMSX': 'FJORD'}
+
+    input_sources = {'collection':collection, 'input_data':input_data}
+
+    # Initialize the hirs_csrb_daily module with the data locations
+    hirs_ctp_daily.set_input_sources(input_sources, satellite=satellite)
+
+    # Instantiate the computation, with one task per block of days if asked to
+    if granularity > 1:
+        return hirs_ctp_daily.HIRS_CTP_DAILY_BLOCK()
+    return hirs_ctp_daily.HIRS_CTP_DAILY()
+
+
+def monthly_intervals(start, end):
+    '''
+    Return a list of month-long intervals covering the days from start to end inclusive.
+    '''
+    wedge = timedelta(seconds=1)
+    intervals = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        left = max(datetime(year, month, 1), datetime(start.year, start.month, start.day))
+        right = min(datetime(year, month, monthrange(year, month)[1]),
+                    datetime(end.year, end.month, end.day))
+        intervals.append(TimeInterval(left, right + timedelta(days=1) - wedge))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return intervals
+
+
+def plan_contexts(comp, intervals, *args):
+    '''
+    Find the contexts for every interval up front, returning them sorted and
+    without duplicates. args are the remaining find_contexts() arguments.
+    '''
+    contexts = {}
+    for interval in intervals:
+        for context in comp.find_contexts(interval, *args):
+            contexts[context['granule']] = context
+    return [contexts[granule] for granule in sorted(contexts)]
+
+
+def prune_existing(comp, contexts, catalog=None, output='out'):
+    '''
+    Return the contexts whose output product isn't already in the product store.
+    The products carry every delivery id of their context, so a day is only
+    skipped if it was made with the same deliveries. output may also be a function
+    returning the output to check for each context.
+    '''
+    if catalog is None:
+        catalog = CachedProductCatalog()
+
+    outputs = [output(context) if callable(output) else output for context in contexts]
+    products = [comp.dataset(name).product(context) for name, context in zip(outputs, contexts)]
+    presence, _ = catalog.lookup(products)
+    missing = [context for context, product in zip(contexts, products)
+               if not presence[product_key(product)]]
+
+    LOG.info("Skipping {} of {} contexts whose output already exists".format(
+        len(contexts) - len(missing), len(contexts)))
+    return missing
+
+
+def prune_existing_blocks(comp, daily_comp, contexts, catalog=None):
+    '''
+    Return the HIRS_CTP_DAILY_BLOCK contexts with a day whose daily file isn't already
+    in the product store, either as the block's own output for the day or as the
+    'out' of daily_comp, a HIRS_CTP_DAILY, for that day. A block with a day which has
+    no inputs is kept, but only orders its other days, through comp.block_datasets().
+    '''
+    if catalog is None:
+        catalog = CachedProductCatalog()
+
+    products = []
+    for context in contexts:
+        products += [comp.dataset(comp.day_output(idx)).product(context)
+                     for idx in range(context['days'])]
+        products += [daily_comp.dataset('out').product(day_context)
+                     for day_context in comp.day_contexts(context)]
+    presence, _ = catalog.lookup(products)
+
+    missing = []
+    for context in contexts:
+        for idx, day_context in enumerate(comp.day_contexts(context)):
+            if not (presence[product_key(comp.dataset(comp.day_output(idx)).product(context))] or
+                    presence[product_key(daily_comp.dataset('out').product(day_context))]):
+                missing.append(context)
+                break
+
+    LOG.info("Skipping {} of {} blocks whose days all exist already".format(
+        len(contexts) - len(missing), len(contexts)))
+    return missing
+
+
+def batch_contexts(contexts, batch_size):
+    '''
+    Split contexts into consecutive batches of at most batch_size contexts.
+    '''
+    return [contexts[idx:idx + batch_size] for idx in range(0, len(contexts), batch_size)]
+
+
+class LocalSubmitter(object):
+    '''
+    Stand-in for flo.ui.safe_submit_order, which hands out job numbers without
+    touching the cluster. latency seconds are spent per submission, and
+    per_context seconds per context, to mimic the real call.
+    '''
+
+    def __init__(self, latency=0., per_context=0., first_job=1):
+        self.latency = latency
+        self.per_context = per_context
+        self._job_numbers = count(first_job)
+        self._lock = threading.Lock()
+
+    def __call__(self, comp, datasets, contexts, download_onlies=None):
+        time.sleep(self.latency + self.per_context * len(contexts))
+        with self._lock:
+            return [next(self._job_numbers) for context in contexts]
+
+
+class SubmissionEngine(object):
+    '''
+    Submit contexts in batches from a bounded pool of worker threads.
+
+    Each batch is passed to submit (safe_submit_order by default), after calling
+    prepare(batch) if given, e.g. to prefetch the batch's orbital contexts. The
+    outcome of every batch is appended to the ledger file as one JSON line.
+
+    datasets is the list of datasets to order for every context, or a function
+    returning the list for a context; consecutive contexts of a batch with the same
+    datasets are then submitted together, and those with none are left out.
+    '''
+
+    def __init__(self, comp, datasets, download_onlies=None, submit=None, prepare=None,
+                 batch_size=31, workers=4, ledger=None):
+        if submit is None:
+            from flo.ui import safe_submit_order
+            submit = safe_submit_order
+        self.comp = comp
+        self.datasets = datasets
+        self.download_onlies = download_onlies if download_onlies is not None else []
+        self.submit = submit
+        self.prepare = prepare
+        self.batch_size = batch_size
+        self.workers = workers
+        self.ledger = ledger
+
+    def _submit_batch(self, args):
+        idx, batch = args
+        record = {'batch': idx,
+                  'satellite': batch[0]['satellite'],
+                  'first': batch[0]['granule'],
+                  'last': batch[-1]['granule'],
+                  'num_contexts': len(batch),
+                  'job_numbers': [],
+                  'status': 'submitted',
+                  'error': None}
+        start = time.time()
+        record['start'] = start
+        try:
+            if self.prepare is not None:
+                self.prepare(batch)
+            for datasets, contexts in self._dataset_groups(batch):
+                job_nums = self.submit(self.comp, datasets, contexts,
+                                       download_onlies=self.download_onlies)
+                record['job_numbers'] += list(job_nums) if job_nums else []
+            if not record['job_numbers']:
+                record['status'] = 'no jobs'
+        except Exception:
+            LOG.warning(traceback.format_exc())
+            record['status'] = 'failed'
+            record['error'] = traceback.format_exc().splitlines()[-1]
+        record['end'] = time.time()
+        record['elapsed'] = record['end'] - start
+        return record
+
+    def _dataset_groups(self, batch):
+        '''
+        Return a list of (datasets, contexts) for the runs of batch ordering the same datasets.
+        '''
+        if not callable(self.datasets):
+            return [(self.datasets, batch)]
+        groups = []
+        for context in batch:
+            datasets = self.datasets(context)
+            if datasets == []:
+                LOG.info("Nothing to order for {}".format(context['granule']))
+                continue
+            if groups and groups[-1][0] == datasets:
+                groups[-1][1].append(context)
+            else:
+                groups.append((datasets, [context]))
+        return groups
+
+    def run(self, contexts):
+        '''
+        Submit contexts, returning the list of ledger records for the batches.
+        '''
+        return self.run_batches(batch_contexts(contexts, self.batch_size))
+
+    def run_batches(self, batches):
+        '''
+        Submit already batched contexts, in order, returning the list of ledger records.
+        '''
+        contexts = [context for batch in batches for context in batch]
+        LOG.info("Submitting {} contexts in {} batches with {} workers".format(
+            len(contexts), len(batches), self.workers))
+
+        records = []
+        start = time.time()
+        ledger = open(self.ledger, 'a') if self.ledger is not None else None
+        pool = ThreadPool(self.workers)
+        try:
+            for record in pool.imap_unordered(self._submit_batch, enumerate(batches)):
+                records.append(record)
+                LOG.info("Batch {}: [{}, {}] {} ({} jobs, {:.1f}s)".format(
+                    record['batch'], record['first'], record['last'], record['status'],
+                    len(record['job_numbers']), record['elapsed']))
+                if ledger is not None:
+                    ledger.write(json.dumps(record, default=str, sort_keys=True) + '\n')
+                    ledger.flush()
+        finally:
+            pool.close()
+            pool.join()
+            if ledger is not None:
+                ledger.close()
+
+        elapsed = time.time() - start
+        LOG.info("Submitted {} contexts in {:.1f}s ({:.1f} contexts/s)".format(
+            len(contexts), elapsed, len(contexts) / elapsed if elapsed > 0 else 0.))
+
+        return sorted(records, key=lambda record: record['batch'])
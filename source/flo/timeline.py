@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Sorted, array-backed timeline of hirs_ctp_orbital contexts, used to select
+         the orbits which make up each day.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import logging
+from datetime import datetime
+
+import numpy as np
+
+# every module should have a LOG object
+LOG = logging.getLogger(__name__)
+
+# Number of orbits either side of the day's own orbits to include in each daily product.
+# Satellites not listed get default_boundary_orbits; use 1 to include the last orbit of
+# the previous day and the first orbit of the next day.
+default_boundary_orbits = 0
+boundary_orbits = {}
+
+
+def day_start(dt):
+    '''
+    Return midnight at the start of the day containing dt.
+    '''
+    return datetime(dt.year, dt.month, dt.day)
+
+
+def to_datetime64(times):
+    return np.array(times, dtype='datetime64[s]')
+
+
+class OrbitalTimeline(object):
+    '''
+    The start times of a set of orbital contexts, as a sorted datetime64 array kept
+    alongside the contexts themselves, so that the orbits of any day can be found
+    by bisection.
+    '''
+
+    def __init__(self, contexts):
+        contexts = sorted(contexts, key=lambda context: context['granule'])
+        self.contexts = contexts
+        self.starts = to_datetime64([context['granule'] for context in contexts])
+
+    def __len__(self):
+        return len(self.contexts)
+
+    def day_bounds(self, days, pad=0):
+        '''
+        Return arrays of the (start, end) slice indices of the orbits for each of days,
+        widened by pad orbits at each end and clipped to the timeline.
+        '''
+        day_starts = to_datetime64([day_start(day) for day in days])
+        day_ends = day_starts + np.timedelta64(1, 'D')
+        start = self.starts.searchsorted(day_starts, side='left') - pad
+        end = self.starts.searchsorted(day_ends, side='left') + pad
+        return np.clip(start, 0, len(self)), np.clip(end, 0, len(self))
+
+    def select(self, day, pad=0):
+        '''
+        Return the contexts starting on day, plus pad orbits either side.
+        '''
+        start, end = self.day_bounds([day], pad)
+        return self.contexts[start[0]:end[0]]
+
+    def select_many(self, days, pad=0):
+        '''
+        Return a list of the selected contexts for each of days.
+        '''
+        starts, ends = self.day_bounds(days, pad)
+        return [self.contexts[start:end] for start, end in zip(starts, ends)]
+
+
+def satellite_boundary_orbits(satellite):
+    return boundary_orbits.get(satellite, default_boundary_orbits)
@@ -8,18 +8,23 @@ Copyright (c) 2015 University of Wisconsin Regents.
 Licensed under GNU GPLv3.
 """
 
-import sys
+import argparse
 import traceback
 import calendar
 import logging
-from calendar import monthrange
-from time import sleep
+from time import sleep, time
 
 from flo.ui import safe_submit_order
 from timeutil import TimeInterval, datetime, timedelta
 
 import flo.sw.hirs_ctp_orbital as hirs_ctp_orbital
 import flo.sw.hirs_ctp_daily as hirs_ctp_daily
+from flo.sw.hirs_ctp_daily.submission import (setup_computation, plan_contexts, prune_existing,
+                                              prune_existing_blocks, batch_contexts, SubmissionEngine,
+                                              LocalSubmitter)
+from flo.sw.hirs_ctp_daily.campaign import load_campaign, plan_campaign, throughput
+from flo.sw.hirs_ctp_daily.orbital_cache import cache_key
+from flo.sw.hirs_ctp_daily.outcome import failure_rates
 from flo.sw.hirs2nc.utils import setup_logging
 
 # every module should have a LOG object
@@ -86,82 +91,242 @@ satellite_choices = ['noaa-06', 'noaa-07', 'noaa-08', 'noaa-09', 'noaa-10', 'noa
                     'noaa-12', 'noaa-14', 'noaa-15', 'noaa-16', 'noaa-17', 'noaa-18',
                     'noaa-19', 'metop-a', 'metop-b']
 
-def setup_computation(satellite):
-
-    input_data = {'HIR1B': '/mnt/software/flo/hirs_l1b_datalists/{0:}/HIR1B_{0:}_latest'.format(satellite),
-                  'CFSR':  '/mnt/cephfs_data/geoffc/hirs_data_lists/CFSR.out',
-                  'PTMSX': '/mnt/software/flo/hirs_l1b_datalists/{0:}/PTMSX_{0:}_latest'.format(satellite)}
-
-    # Data locations
-    collection = {'HIR1B': 'ILIAD',
-                  'CFSR': 'DELTA',
-                  'PTMSX': 'FJORD'}
-
-    input_sources = {'collection':collection, 'input_data':input_data}
-
-    # Initialize the hirs_csrb_daily module with the data locations
-    hirs_ctp_daily.set_input_sources(input_sources)
-
-    # Instantiate the computation
-    comp = hirs_ctp_daily.HIRS_CTP_DAILY()
-
-    return comp
-
-LOG.info("Submitting intervals...")
-
-dt = datetime.utcnow()
-log_name = 'hirs_ctp_daily_{}_s{}_e{}_c{}.log'.format(
-    satellite,
-    intervals[0].left.strftime('%Y%m%d%H%M'),
-    intervals[-1].right.strftime('%Y%m%d%H%M'),
-    dt.strftime('%Y%m%d%H%M%S'))
-
-try:
-
-    for interval in intervals:
-        LOG.info("Submitting interval {} -> {}".format(interval.left, interval.right))
-
-        comp = setup_computation(satellite)
-        hirs_ctp_orbital_comp = hirs_ctp_orbital.HIRS_CTP_ORBITAL()
-
-        contexts = comp.find_contexts(interval, satellite, hirs2nc_delivery_id, hirs_avhrr_delivery_id,
-                                      hirs_csrb_daily_delivery_id, hirs_csrb_monthly_delivery_id,
-                                      hirs_ctp_orbital_delivery_id, hirs_ctp_daily_delivery_id)
-
-        LOG.info("Opening log file {}".format(log_name))
-        file_obj = open(log_name,'a')
-
-        LOG.info("\tThere are {} contexts in this interval".format(len(contexts)))
-        contexts.sort()
-
-        if contexts != []:
-            #for context in contexts:
-                #LOG.info(context)
-
-            LOG.info("\tFirst context: {}".format(contexts[0]))
-            LOG.info("\tLast context:  {}".format(contexts[-1]))
-
-            try:
-                job_nums = []
-                job_nums = safe_submit_order(comp, [comp.dataset('out')], contexts, download_onlies=[hirs_ctp_orbital_comp])
-
-                if job_nums != []:
-                    #job_nums = range(len(contexts))
-                    #LOG.info("\t{}".format(job_nums))
-
-                    file_obj.write("contexts: [{}, {}]; job numbers: {{{}..{}}}\n".format(contexts[0], contexts[-1], job_nums[0],job_nums[-1]))
-                    LOG.info("contexts: [{}, {}]; job numbers: {{{},{}}}".format(contexts[0], contexts[-1], job_nums[0],job_nums[-1]))
-                    LOG.info("job numbers: {{{}..{}}}\n".format(job_nums[0],job_nums[-1]))
-                else:
-                    LOG.info("contexts: {{{}, {}}}; --> no jobs".format(contexts[0], contexts[-1]))
-                    file_obj.write("contexts: {{{}, {}}}; --> no jobs\n".format(contexts[0], contexts[-1]))
-            except Exception:
-                LOG.warning(traceback.format_exc())
-
-            #sleep(10.)
-
-        LOG.info("Closing log file {}".format(log_name))
-        file_obj.close()
-
-except Exception:
-    LOG.warning(traceback.format_exc())
+def prefetch(batch):
+    # Days in the mission plan don't query the orbital catalog at all
+    plan = hirs_ctp_daily.mission_plan
+    if plan is not None and all(plan.covers(context) for context in batch):
+        return
+    # Fetch the orbital contexts for the whole batch once, rather than once per day
+    last_day = batch[-1]['granule'] + timedelta(days=batch[-1].get('days', 1) - 1)
+    hirs_ctp_daily.prefetch_orbital_contexts(TimeInterval(batch[0]['granule'], last_day),
+                                             *cache_key(batch[0]))
+
+def ready_contexts(scheduler, contexts):
+    '''
+    Return the contexts whose days have enough CTP Orbital coverage to be submitted.
+    '''
+    due = scheduler.due(contexts)
+    if due == []:
+        return []
+    # One orbital query for the whole range, with a day either side for the boundary orbits.
+    # Orbits may have landed since the range was last queried, so ask the catalog again;
+    # the batches submitted then get their tasks built from the fresh orbits too.
+    last_day = due[-1]['granule'] + timedelta(days=due[-1].get('days', 1))
+    window = TimeInterval(due[0]['granule'] - day, last_day + day)
+    hirs_ctp_daily.orbital_cache.invalidate_interval(window, due[0])
+    orbital_contexts = hirs_ctp_daily.orbital_cache.find_contexts(window, due[0])
+    return scheduler.schedule(due, orbital_contexts)
+
+def check_outcomes(ledger, satellite, delivery_id, force=False):
+    '''
+    Return whether to submit satellite with delivery_id, given the task outcomes in ledger.
+    A delivery which keeps failing is only submitted if forced, clearing its failures.
+    '''
+    if not ledger.is_suspect(satellite, delivery_id):
+        return True
+    if not force:
+        LOG.error("hirs_ctp_daily delivery {} keeps failing for {}, not submitting (use --force "
+                  "to submit anyway)".format(delivery_id, satellite))
+        return False
+    # Otherwise the tasks would skip themselves when they find the same failures
+    LOG.warning("Clearing the failures of hirs_ctp_daily delivery {} for {}".format(delivery_id, satellite))
+    ledger.clear(satellite, delivery_id)
+    return True
+
+def log_failure_rates(ledger):
+    for (sat, delivery_id), stats in sorted(failure_rates(ledger.records()).items()):
+        LOG.info("{} {}: {tasks} tasks, {success} succeeded, {transient} transient and {permanent} "
+                 "permanent failures ({failure_rate:.0%})".format(sat, delivery_id, **stats))
+
+def submit(satellite, intervals, batch_size=31, workers=4, dry_run=False, force=False, granularity=1,
+           readiness_state=None, min_coverage=0.9, watch=False, mission_plan=None, outcomes=None):
+
+    LOG.info("Submitting intervals...")
+
+    dt = datetime.utcnow()
+    log_name = 'hirs_ctp_daily_{}_s{}_e{}_c{}.log'.format(
+        satellite,
+        intervals[0].left.strftime('%Y%m%d%H%M'),
+        intervals[-1].right.strftime('%Y%m%d%H%M'),
+        dt.strftime('%Y%m%d%H%M%S'))
+
+    comp = setup_computation(satellite, granularity)
+
+    # Don't submit for a delivery which keeps failing permanently for this satellite
+    if outcomes is not None:
+        hirs_ctp_daily.set_outcome_ledger(outcomes)
+    ledger = hirs_ctp_daily.outcome_ledger
+    if ledger is not None:
+        log_failure_rates(ledger)
+        if not check_outcomes(ledger, satellite, hirs_ctp_daily_delivery_id, force):
+            return []
+    hirs_ctp_orbital_comp = hirs_ctp_orbital.HIRS_CTP_ORBITAL()
+
+    args = [satellite, hirs2nc_delivery_id, hirs_avhrr_delivery_id, hirs_csrb_daily_delivery_id,
+            hirs_csrb_monthly_delivery_id, hirs_ctp_orbital_delivery_id, hirs_ctp_daily_delivery_id]
+    if granularity > 1:
+        args.append(granularity)
+
+    # Take the days, and their inputs, from the mission plan if there is one
+    if mission_plan is not None:
+        hirs_ctp_daily.set_mission_plan(mission_plan)
+    plan = hirs_ctp_daily.mission_plan
+    if plan is not None and granularity == 1 and plan.delivery_ids == dict(zip(comp.parameters[2:], args[1:])):
+        contexts = plan.contexts(satellite, intervals[0].left, intervals[-1].right)
+    else:
+        if plan is not None:
+            LOG.warning("Not using the mission plan, it was made for other deliveries or granularity")
+        contexts = plan_contexts(comp, intervals, *args)
+
+    LOG.info("\tThere are {} contexts in these intervals".format(len(contexts)))
+
+    # Only submit the days which haven't been made already, unless forced to. A block is
+    # only skipped once every one of its days has been made, by a block or on its own.
+    if not force:
+        if granularity > 1:
+            contexts = prune_existing_blocks(comp, hirs_ctp_daily.HIRS_CTP_DAILY(), contexts)
+        else:
+            contexts = prune_existing(comp, contexts)
+    if contexts == []:
+        return []
+
+    # The daily files, just those of the days in each block which have inputs
+    engine = SubmissionEngine(comp, comp.block_datasets if granularity > 1 else [comp.dataset('out')],
+                              download_onlies=[hirs_ctp_orbital_comp],
+                              submit=LocalSubmitter() if dry_run else safe_submit_order,
+                              prepare=None if dry_run else prefetch,
+                              batch_size=batch_size, workers=workers, ledger=log_name)
+    LOG.info("Writing job ledger {}".format(log_name))
+
+    if readiness_state is None:
+        LOG.info("\tFirst context: {}".format(contexts[0]))
+        LOG.info("\tLast context:  {}".format(contexts[-1]))
+        return engine.run(contexts)
+
+    # Only submit the days with enough orbital coverage, rechecking the others later
+    from flo.sw.hirs_ctp_daily.readiness import ReadinessScheduler
+    scheduler = ReadinessScheduler(readiness_state, min_coverage=min_coverage,
+                                   require_boundary=hirs_ctp_daily.satellite_boundary_orbits(satellite) > 0)
+    if force:
+        scheduler.reset(contexts)
+    records = []
+    while True:
+        ready = ready_contexts(scheduler, contexts)
+        if ready != []:
+            batches = batch_contexts(ready, batch_size)
+            batch_records = engine.run_batches(batches)
+            scheduler.mark_submitted([context for record in batch_records if record['status'] == 'submitted'
+                                      for context in batches[record['batch']]])
+            records += batch_records
+
+        next_check = scheduler.next_check()
+        if not watch or next_check is None:
+            break
+        LOG.info("Waiting until {} to recheck the days without coverage".format(
+            datetime.utcfromtimestamp(next_check)))
+        sleep(max(next_check - time(), 0))
+
+    return records
+
+def submit_campaign(table, batch_size=31, workers=4, dry_run=False, force=False, granularity=1,
+                    outcomes=None):
+
+    delivery_ids = {'hirs2nc_delivery_id': hirs2nc_delivery_id,
+                    'hirs_avhrr_delivery_id': hirs_avhrr_delivery_id,
+                    'hirs_csrb_daily_delivery_id': hirs_csrb_daily_delivery_id,
+                    'hirs_csrb_monthly_delivery_id': hirs_csrb_monthly_delivery_id,
+                    'hirs_ctp_orbital_delivery_id': hirs_ctp_orbital_delivery_id,
+                    'hirs_ctp_daily_delivery_id': hirs_ctp_daily_delivery_id}
+    entries = load_campaign(table, delivery_ids)
+    if entries == []:
+        LOG.warning("The campaign table {} has no entries".format(table))
+        return []
+
+    # Leave out the satellites whose delivery keeps failing permanently
+    if outcomes is not None:
+        hirs_ctp_daily.set_outcome_ledger(outcomes)
+    ledger = hirs_ctp_daily.outcome_ledger
+    if ledger is not None:
+        log_failure_rates(ledger)
+        entries = [entry for entry in entries
+                   if check_outcomes(ledger, entry['satellite'], entry['hirs_ctp_daily_delivery_id'], force)]
+        if entries == []:
+            return []
+
+    dt = datetime.utcnow()
+    log_name = 'hirs_ctp_daily_campaign_c{}.log'.format(dt.strftime('%Y%m%d%H%M%S'))
+
+    # Each satellite gets its own data lists, and its own entries in the orbital context cache
+    for entry in entries:
+        comp = setup_computation(entry['satellite'], granularity)
+    hirs_ctp_orbital_comp = hirs_ctp_orbital.HIRS_CTP_ORBITAL()
+
+    batches = plan_campaign(comp, entries, batch_size, incremental=not force, granularity=granularity,
+                            daily_comp=hirs_ctp_daily.HIRS_CTP_DAILY())
+
+    engine = SubmissionEngine(comp, comp.block_datasets if granularity > 1 else [comp.dataset('out')],
+                              download_onlies=[hirs_ctp_orbital_comp],
+                              submit=LocalSubmitter() if dry_run else safe_submit_order,
+                              prepare=None if dry_run else prefetch,
+                              batch_size=batch_size, workers=workers, ledger=log_name)
+
+    LOG.info("Writing job ledger {}".format(log_name))
+    records = engine.run_batches(batches)
+
+    for sat, stats in sorted(throughput(records).items()):
+        LOG.info("{}: {contexts} contexts, {jobs} jobs, {failed_batches} failed batches in "
+                 "{elapsed:.1f}s ({contexts_per_second:.2f} contexts/s)".format(sat, **stats))
+
+    return records
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Submit hirs_ctp_daily contexts to the cluster.')
+    parser.add_argument('--batch-size', type=int, default=31,
+                        help='number of contexts per submission (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='number of concurrent submissions (default: %(default)s)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='plan and batch the contexts, but submit them to a local stand-in')
+    parser.add_argument('--campaign', metavar='TABLE',
+                        help='JSON table of satellites, date ranges and delivery ids to submit together')
+    parser.add_argument('--force', action='store_true',
+                        help='submit every day, even those whose output already exists, clear '
+                             'the recorded failures of a delivery which keeps failing, and recheck '
+                             'the readiness of days given up on or already submitted')
+    parser.add_argument('--granularity', type=int, default=1,
+                        help='number of consecutive days made by each task (default: %(default)s)')
+    parser.add_argument('--readiness-state', metavar='FILE',
+                        help='only submit days with enough orbital coverage, keeping track of the '
+                             'others in this JSON file so later runs recheck them with backoff')
+    parser.add_argument('--min-coverage', type=float, default=0.9,
+                        help='with --readiness-state, fraction of a day the orbits must cover '
+                             '(default: %(default)s)')
+    parser.add_argument('--mission-plan', metavar='MANIFEST',
+                        help='submit the days planned in this manifest, made by plan_hirs_ctp_daily.py, '
+                             'taking their inputs from it rather than the catalogs')
+    parser.add_argument('--outcomes', metavar='LEDGER',
+                        help='shared ledger of task outcomes, to report failure rates from and to stop '
+                             'submitting a delivery which keeps failing')
+    parser.add_argument('--watch', action='store_true',
+                        help='with --readiness-state, keep running until no days are waiting')
+    args = parser.parse_args()
+
+    if args.campaign is not None:
+        for option, value in [('--readiness-state', args.readiness_state),
+                              ('--mission-plan', args.mission_plan), ('--watch', args.watch)]:
+            if value:
+                parser.error('{} is not supported with --campaign'.format(option))
+
+    try:
+        if args.campaign is not None:
+            submit_campaign(args.campaign, batch_size=args.batch_size, workers=args.workers,
+                            dry_run=args.dry_run, force=args.force, granularity=args.granularity,
+                            outcomes=args.outcomes)
+        else:
+            submit(satellite, intervals, batch_size=args.batch_size, workers=args.workers,
+                   dry_run=args.dry_run, force=args.force, granularity=args.granularity,
+                   readiness_state=args.readiness_state, min_coverage=args.min_coverage,
+                   watch=args.watch, mission_plan=args.mission_plan, outcomes=args.outcomes)
+    except Exception:
+        LOG.warning(traceback.format_exc())
@@ -1,41 +1,61 @@
-from datetime import datetime
-import os
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+
+Purpose: Publish the hirs_ctp_daily products for a satellite and date range into the
+         results tree.
+
+Copyright (c) 2015 University of Wisconsin Regents.
+Licensed under GNU GPLv3.
+"""
+
+import argparse
+from datetime import datetime, timedelta
 from flo.config import config
-from flo.product import StoredProductCatalog
 from flo.time import TimeInterval
 from flo.sw.hirs_ctp_daily import HIRS_CTP_DAILY
+from flo.sw.hirs_ctp_daily.publish import publish
+from flo.sw.hirs2nc.utils import setup_logging
 
 # every module should have a LOG object
 import logging, traceback
 LOG = logging.getLogger(__name__)
 
 
-def symlink(c, output, contexts):
+def symlink(c, output, contexts, workers=8, granularity=1):
 
-    SPC = StoredProductCatalog()
+    return publish(c, contexts, config.get()['product_dir'], config.get()['results_dir'],
+                   output=output, workers=workers, granularity=granularity)
 
-    for context in contexts:
-        if SPC.exists(c.dataset(output).product(context)):
-            s_path = os.path.join(config.get()['product_dir'],
-                                  SPC.file(c.dataset(output).product(context)).path)
-            d_path = os.path.join(config.get()['results_dir'],
-                                  c.context_path(context, output))
-            file_name = os.path.basename(s_path)
+def parse_date(text):
+    return datetime.strptime(text, '%Y-%m-%d')
 
-            if not os.path.exists(d_path):
-                os.makedirs(d_path)
+parser = argparse.ArgumentParser(description='Symlink hirs_ctp_daily products into the results tree.')
+parser.add_argument('satellite')
+parser.add_argument('start', type=parse_date, help='first day, as YYYY-MM-DD')
+parser.add_argument('end', type=parse_date, help='last day, as YYYY-MM-DD')
+parser.add_argument('--hirs2nc-delivery-id', default='20180410-1')
+parser.add_argument('--hirs-avhrr-delivery-id', default='20180505-1')
+parser.add_argument('--hirs-csrb-daily-delivery-id', default='20180714-1')
+parser.add_argument('--hirs-csrb-monthly-delivery-id', default='20180516-1')
+parser.add_argument('--hirs-ctp-orbital-delivery-id', default='20180730-1')
+parser.add_argument('--hirs-ctp-daily-delivery-id', default='20180802-1')
+parser.add_argument('--workers', type=int, default=8,
+                    help='number of threads making links (default: %(default)s)')
+parser.add_argument('--granularity', type=int, default=1,
+                    help='days per HIRS_CTP_DAILY_BLOCK task which may have made the daily '
+                         'files (default: %(default)s)')
+args = parser.parse_args()
 
-            if not os.path.isfile(os.path.join(d_path, file_name)):
-                os.symlink(s_path, os.path.join(d_path, file_name))
+setup_logging(2)
 
 output = 'out'
-sat = 'metop-a'
-hirs_version = 'v20151014'
-collo_version = 'v20140204'
-csrb_version = 'v20150915'
-ctp_version = 'v20150915'
-interval = TimeInterval(datetime(2009, 1, 1), datetime(2009, 2, 1))
+interval = TimeInterval(args.start, args.end + timedelta(days=1) - timedelta(seconds=1))
 
 c = HIRS_CTP_DAILY()
-contexts = c.find_contexts(sat, hirs_version, collo_version, csrb_version, ctp_version, interval)
-symlink(c, output, contexts)
+contexts = c.find_contexts(interval, args.satellite, args.hirs2nc_delivery_id,
+                           args.hirs_avhrr_delivery_id, args.hirs_csrb_daily_delivery_id,
+                           args.hirs_csrb_monthly_delivery_id, args.hirs_ctp_orbital_delivery_id,
+                           args.hirs_ctp_daily_delivery_id)
+summary = symlink(c, output, contexts, workers=args.workers, granularity=args.granularity)
+print('{created} created, {updated} updated, {skipped} skipped, {missing} missing'.format(**summary))